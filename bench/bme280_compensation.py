@@ -0,0 +1,122 @@
+"""
+Compares the BME280 32-bit compensation against the 64-bit reference.
+
+Every raw sample is compensated by both implementations: temperature and
+humidity must be equal. The 32-bit pressure formula rounds earlier, so the
+pressures only have to agree within PRESSURE_TOLERANCE, which is below the
+sensor's relative accuracy of 12 Pa. Then the time and, on MicroPython, the
+heap allocated per call are measured.
+
+The samples cover the sensor's operating range (-40..85 degC, 300..1100 hPa,
+0..100 %RH) with two calibration sets: the example values from the datasheet
+and a second, typical set with a different sign of dig_T3 and dig_P5.
+
+Runs on CPython and on the device (copy it next to the bme280 library):
+
+    python bench/bme280_compensation.py
+    mpremote run bench/bme280_compensation.py
+"""
+import sys
+import time
+from array import array
+
+if sys.implementation.name != 'micropython':
+    import os
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    sys.path.insert(0, root)
+    sys.path.insert(0, os.path.join(root, 'libs'))
+    import sim
+    sim.install()
+
+import gc
+from ustruct import pack
+from bme280 import bme280
+
+PRESSURE_TOLERANCE = 10  # Pa
+
+# dig_T1..T3, dig_P1..P9, dig_H1..H6
+CALIBRATIONS = (
+    (27504, 26435, -1000, 36477, -10685, 3024, 2855, 140, -7, 15500, -14600, 6000,
+     75, 362, 0, 313, 50, 30),
+    (28478, 26498, 50, 37739, -10558, 3024, 5986, -97, -7, 12300, -7600, 4913,
+     75, 355, 0, 340, 0, 30),
+)
+
+class _CalibrationI2C:
+    def __init__(self, cal):
+        t1, t2, t3, p1, p2, p3, p4, p5, p6, p7, p8, p9, h1, h2, h3, h4, h5, h6 = cal
+        self._regs = {
+            0x88: pack("<HhhHhhhhhhhhBB", t1, t2, t3, p1, p2, p3, p4, p5, p6, p7, p8, p9, 0, h1),
+            0xE1: pack("<hBbBbb", h2, h3, h4 >> 4, (h4 & 0xF) | (h5 & 0xF) << 4, h5 >> 4, h6),
+        }
+
+    def readfrom_mem(self, addr, reg, n):
+        return self._regs[reg][:n]
+
+    def writeto_mem(self, addr, reg, buf):
+        pass
+
+def _samples(sensor):
+    """
+    Raw readings whose reference values lie in the operating range.
+    """
+    ref = array('i', [0, 0, 0])
+    samples = []
+    for raw_temp in range(380000, 680000, 15013):
+        for raw_press in range(150000, 700000, 27011):
+            for raw_hum in range(15000, 60000, 4507):
+                sensor.compensate((raw_temp, raw_press, raw_hum), ref)
+                pressure = ref[1] // 256
+                if -4000 <= ref[0] <= 8500 and 30000 <= pressure <= 110000:
+                    samples.append((raw_temp, raw_press, raw_hum))
+    return samples
+
+def _compare(sensor, samples):
+    ref = array('i', [0, 0, 0])
+    fast = array('i', [0, 0, 0])
+    mismatches = 0
+    max_diff = 0
+    for raw in samples:
+        sensor.compensate(raw, ref)
+        sensor.compensate_int32(raw, fast)
+        diff = abs(fast[1] - ref[1] // 256)
+        max_diff = max(max_diff, diff)
+        if fast[0] != ref[0] or fast[2] != ref[2] or diff > PRESSURE_TOLERANCE:
+            mismatches += 1
+            if mismatches <= 5:
+                print("  mismatch raw={} ref={} int32={}".format(raw, list(ref), list(fast)))
+    return mismatches, max_diff
+
+def _measure(fn, raw, result, n):
+    gc.collect()
+    # Off the device gc.mem_alloc() is sim's stand-in, which doesn't see these allocations
+    alloc = gc.mem_alloc if sys.implementation.name == 'micropython' else None
+    before = alloc() if alloc else 0
+    start = time.ticks_us()
+    for _ in range(n):
+        fn(raw, result)
+    elapsed = time.ticks_diff(time.ticks_us(), start)
+    after = alloc() if alloc else 0
+    return elapsed / n, (after - before) / n if alloc else None
+
+def main(n=2000):
+    ok = True
+    for i, cal in enumerate(CALIBRATIONS):
+        sensor = bme280.BME280(i2c=_CalibrationI2C(cal))
+        samples = _samples(sensor)
+        mismatches, max_diff = _compare(sensor, samples)
+        print("calibration {}: {} samples, {} mismatches, max pressure diff {} Pa".format(
+            i, len(samples), mismatches, max_diff))
+        ok = ok and mismatches == 0
+
+    # a typical indoor reading, about 25 degC, 1000 hPa, 50 %RH
+    raw = array('i', [519888, 415148, 27000])
+    result = array('i', [0, 0, 0])
+    for name, fn in (('reference', sensor.compensate), ('int32', sensor.compensate_int32)):
+        us, heap = _measure(fn, raw, result, n)
+        print("{:10s} {:8.1f} us/call  {} bytes/call".format(
+            name, us, 'n/a' if heap is None else '{:.1f}'.format(heap)))
+    return ok
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,73 @@
+"""
+Stress test of the FrameGrabber handoff between the capture thread and asyncio.
+
+Runs on CPython with the fake camera from sim/. A consumer task takes frames
+with random pauses while the thread captures as fast as it can, and every
+frame taken is checked to be newer than the previous one and intact, both
+when it is taken and again after the pause. The fake camera reuses its
+frame buffers like the driver, so a frame handed out without being copied
+is overwritten while the consumer still holds it.
+
+    python bench/capture_thread_stress.py --seconds 10 --fps 200
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import sim
+sim.install()
+
+from sim.camera import Camera, frame_info
+from capture_thread import FrameGrabber
+
+async def _consume(grabber, seconds, max_pause_ms):
+    taken = 0
+    corrupt = 0
+    out_of_order = 0
+    last_seq = 0
+    loop = asyncio.get_running_loop()
+    end = loop.time() + seconds
+
+    while loop.time() < end:
+        frame = await grabber.next_frame()
+        if frame is None:
+            break
+        seq, intact = frame_info(frame)
+        taken += 1
+        if seq <= last_seq:
+            out_of_order += 1
+        last_seq = seq
+        if max_pause_ms:
+            await asyncio.sleep_ms(random.randint(0, max_pause_ms))
+        # Still the same frame after the camera went on capturing
+        if not intact or frame_info(frame) != (seq, True):
+            corrupt += 1
+
+    return taken, corrupt, out_of_order
+
+async def main(seconds, fps, max_pause_ms):
+    Camera.fps = fps
+    cam = Camera(init=True)
+    grabber = FrameGrabber(cam)
+    grabber.start()
+    taken, corrupt, out_of_order = await _consume(grabber, seconds, max_pause_ms)
+    await grabber.stop()
+
+    print(f"captured:     {grabber.frames_captured}")
+    print(f"taken:        {taken}")
+    print(f"missed:       {grabber.frames_missed}")
+    print(f"corrupt:      {corrupt}")
+    print(f"out of order: {out_of_order}")
+    return corrupt == 0 and out_of_order == 0
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--fps', type=int, default=200, help="fake camera frame rate")
+    parser.add_argument('--max-pause-ms', type=int, default=20, help="longest random pause of the consumer")
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(main(args.seconds, args.fps, args.max_pause_ms)) else 1)
@@ -0,0 +1,83 @@
+"""
+Throughput of the HTTP request parser on canned requests.
+
+Each request is fed to read_request() from an in-memory stream, whole and
+split into small segments as a slow TCP connection would deliver it, and
+its route is looked up like handle_client() does.
+
+    python bench/http_parser.py --iterations 20000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import sim
+sim.install()
+
+import http_request
+import stream_server
+
+_BROWSER_HEADERS = (
+    b'Host: 192.168.1.50\r\n'
+    b'User-Agent: Mozilla/5.0 (X11; Linux x86_64; rv:128.0) Gecko/20100101 Firefox/128.0\r\n'
+    b'Accept: text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8\r\n'
+    b'Accept-Language: en-US,en;q=0.5\r\n'
+    b'Accept-Encoding: gzip, deflate\r\n'
+    b'Connection: keep-alive\r\n'
+    b'Upgrade-Insecure-Requests: 1\r\n'
+)
+
+REQUESTS = {
+    'index': b'GET / HTTP/1.1\r\n' + _BROWSER_HEADERS + b'\r\n',
+    'stream': b'GET /stream?fps=5&decimate=2 HTTP/1.1\r\nHost: 192.168.1.50\r\n\r\n',
+    'capture': b'GET /capture HTTP/1.1\r\nHost: 192.168.1.50\r\nIf-None-Match: "3f2a-1234"\r\n\r\n',
+    'get': b'GET /get_quality HTTP/1.1\r\n' + _BROWSER_HEADERS + b'\r\n',
+    'set': b'GET /set_brightness?value=-1 HTTP/1.1\r\n' + _BROWSER_HEADERS + b'\r\n',
+}
+
+class _Reader:
+    """
+    Stream reader over canned data, delivering at most `segment` bytes at a time.
+    """
+    def __init__(self, data, segment):
+        self._data = data
+        self._segment = segment
+        self._pos = 0
+
+    async def readline(self):
+        # Assemble the line from segments like a StreamReader does
+        line = b''
+        while not line.endswith(b'\n') and self._pos < len(self._data):
+            end = min(self._pos + self._segment, len(self._data))
+            newline = self._data.find(b'\n', self._pos, end)
+            if newline >= 0:
+                end = newline + 1
+            line += self._data[self._pos:end]
+            self._pos = end
+        return line
+
+async def _parse_all(data, segment, iterations):
+    for _ in range(iterations):
+        request = await http_request.read_request(_Reader(data, segment))
+        stream_server._route(request.path)
+
+def main(iterations, segment):
+    print(f"{'request':10s} {'bytes':>6s} {'whole us':>10s} {f'{segment}B segs us':>14s}")
+    for name, data in REQUESTS.items():
+        times = []
+        for seg in (len(data), segment):
+            start = time.perf_counter()
+            asyncio.run(_parse_all(data, seg, iterations))
+            times.append((time.perf_counter() - start) * 1e6 / iterations)
+        print(f"{name:10s} {len(data):>6d} {times[0]:>10.1f} {times[1]:>14.1f}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=10000)
+    parser.add_argument('--segment', type=int, default=16, help="bytes per simulated TCP segment")
+    args = parser.parse_args()
+    main(args.iterations, args.segment)
@@ -0,0 +1,94 @@
+"""
+I2C transaction timing of the sensor code against the emulated sensors.
+
+Counts the transactions and bytes of booting the sensor (with and without the
+calibration cache) and of one reading, and models the time they take on
+the bit-banged SoftI2C and on the hardware peripheral. The bus models are
+estimates, pass the clock and per-transaction overhead measured on a board
+to refine them.
+
+    python bench/i2c_timing.py
+    python bench/i2c_timing.py --soft-khz 150 --soft-overhead-us 60
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+from array import array
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, root)
+sys.path.insert(0, os.path.join(root, 'libs'))
+
+import sim
+sim.install()
+
+from sim import i2c as sim_i2c
+import bme280_if
+from bme280 import bme280
+from bmp280 import bmp280
+
+async def _no_sleep(ms):
+    pass
+
+def _boot(bus, cached):
+    """
+    What bme280_if.sensor_init() does once the bus is open.
+    """
+    address, chip_id = bme280_if.detect(bus)
+    return bme280_if._open_sensor(bus, address, chip_id, bme280_if.chip_name(chip_id), cached)
+
+def _read(sensor):
+    result = array('i', [0, 0, 0])
+    if isinstance(sensor, bme280.BME280):
+        asyncio.run(sensor.read_int32_async(result))
+    else:
+        asyncio.run(sensor.measure_async(result))
+
+def _read_properties(sensor):
+    # The BMP280 driver's per-property reads, before measure()
+    sensor.force_measure()
+    sensor.temperature
+    sensor.pressure
+
+def _run(device, bus_args):
+    bus = sim_i2c.I2C({0x76: device}, *bus_args)
+    rows = []
+
+    def measure(name, fn, *args):
+        bus.reset_stats()
+        fn(*args)
+        rows.append((name, bus.transactions, bus.bytes, bus.elapsed_us))
+
+    measure("boot", _boot, bus, False)
+    measure("boot, cached calibration", _boot, bus, True)
+    sensor = _boot(bus, True)
+    measure("reading", _read, sensor)
+    if isinstance(sensor, bmp280.BMP280):
+        measure("reading, per property", _read_properties, sensor)
+    return rows
+
+def main(args):
+    asyncio.sleep_ms = _no_sleep
+    buses = (
+        ("SoftI2C", (args.soft_khz * 1000, args.soft_overhead_us)),
+        ("I2C", (args.hard_khz * 1000, args.hard_overhead_us)),
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        bme280_if.CAL_FILE = os.path.join(tmp, 'sensor_cal.bin')
+        for device in (sim_i2c.BME280Device(), sim_i2c.BMP280Device()):
+            print(f"{type(device).__name__[:6]}")
+            results = [_run(device, bus_args) for _, bus_args in buses]
+            print(f"  {'':26s} {'trans':>5s} {'bytes':>6s}" + "".join(f" {name:>10s}" for name, _ in buses))
+            for i, (name, transactions, nbytes, _) in enumerate(results[0]):
+                times = "".join(f" {rows[i][3]:>8d}us" for rows in results)
+                print(f"  {name:26s} {transactions:>5d} {nbytes:>6d}{times}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--soft-khz', type=int, default=100, help="effective clock of the bit-banged bus")
+    parser.add_argument('--soft-overhead-us', type=int, default=50, help="per-transaction overhead of SoftI2C")
+    parser.add_argument('--hard-khz', type=int, default=400)
+    parser.add_argument('--hard-overhead-us', type=int, default=10, help="per-transaction overhead of the I2C driver")
+    main(parser.parse_args())
@@ -0,0 +1,363 @@
+"""
+Load test of the stream server with concurrent viewers, settings and page loads.
+
+N clients watch /stream while control clients poll /get_ and /set_ on a
+persistent connection and others load the settings page. Reported are the
+delivered fps, frame interval jitter, time to first frame and bytes/s of
+every viewer, request latencies and the peak and steady heap use of the
+server, read from its /metrics every half second.
+
+Without --host the server runs on the fake camera from sim/ in a separate
+process, so its blocking captures don't hold up the clients, with --host
+it is pointed at a device. Every run is appended as one JSON line to
+--output and compared with the previous run of the same scenario in that
+file.
+
+    python bench/stream_load.py --viewers 4 --seconds 20 --output bench/stream_load.jsonl
+    python bench/stream_load.py --host 192.168.1.50 --viewers 2 --viewer-fps 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, root)
+
+# Metrics compared with the previous run, and whether higher is better
+_COMPARED = (('fps', True), ('jitter_ms', False), ('ttff_ms', False), ('bytes_per_s', True),
+             ('control_p95_ms', False), ('index_p95_ms', False), ('heap_peak', False), ('heap_steady', False))
+# Changes smaller than this are noise, not regressions
+_WORSE_PERCENT = 5
+
+async def _read_headers(reader):
+    """
+    Reads a response or part header, returns (status line, dict of lower case headers).
+    """
+    status = (await reader.readline()).decode().strip()
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError("connection closed in the header")
+        if line in (b'\r\n', b'\n'):
+            return status, headers
+        name, _, value = line.decode().partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+async def _discard(reader, length):
+    # In pieces, so the client doesn't hold whole frames on the heap it measures
+    while length > 0:
+        data = await reader.read(min(length, 65536))
+        if not data:
+            raise ConnectionError("connection closed in the body")
+        length -= len(data)
+
+async def _viewer(host, port, path, end):
+    loop = asyncio.get_running_loop()
+    stats = {'frames': 0, 'bytes': 0, 'ttff_ms': None, 'intervals': [], 'error': None}
+    requested = loop.time()
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n'.encode())
+        status, _ = await _read_headers(reader)
+        if ' 200 ' not in status + ' ':
+            raise ConnectionError(status)
+        last = None
+        while True:
+            remaining = end - loop.time()
+            if remaining <= 0:
+                break
+            # Every part starts with CRLF, then the boundary and its headers
+            await asyncio.wait_for(reader.readline(), remaining)
+            _, headers = await asyncio.wait_for(_read_headers(reader), remaining)
+            length = int(headers['content-length'])
+            await asyncio.wait_for(_discard(reader, length), remaining)
+
+            now = loop.time()
+            if last is None:
+                stats['ttff_ms'] = (now - requested) * 1000
+                stats['start'] = now
+            else:
+                stats['intervals'].append((now - last) * 1000)
+            last = now
+            stats['frames'] += 1
+            stats['bytes'] += length
+    except asyncio.TimeoutError:
+        pass
+    except (ConnectionError, OSError, ValueError, KeyError) as e:
+        stats['error'] = repr(e)
+    finally:
+        stats['end'] = loop.time()
+        writer.close()
+    return stats
+
+async def _requests(host, port, paths, interval, end, keep_alive):
+    """
+    Requests `paths` in turn every `interval` seconds until `end`, returns the latencies in ms.
+    """
+    loop = asyncio.get_running_loop()
+    latencies = []
+    errors = 0
+    connection = None
+    i = 0
+    while loop.time() < end:
+        path = paths[i % len(paths)]
+        i += 1
+        started = loop.time()
+        try:
+            if connection is None:
+                connection = await asyncio.open_connection(host, port)
+            reader, writer = connection
+            header = 'keep-alive' if keep_alive else 'close'
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\nAccept-Encoding: gzip\r\n'
+                         f'Connection: {header}\r\n\r\n'.encode())
+            status, headers = await _read_headers(reader)
+            await _discard(reader, int(headers.get('content-length', 0)))
+            if status.split()[1] not in ('200', '304'):
+                errors += 1
+            latencies.append((loop.time() - started) * 1000)
+            if not keep_alive or headers.get('connection') == 'close':
+                writer.close()
+                connection = None
+        except (ConnectionError, OSError, ValueError, IndexError):
+            errors += 1
+            connection = None
+        await asyncio.sleep(interval)
+    if connection:
+        connection[1].close()
+    return latencies, errors
+
+async def _heap_sampler(host, port, samples, end):
+    # Allocated heap as the server reports it on /metrics
+    loop = asyncio.get_running_loop()
+    connection = None
+    while loop.time() < end:
+        try:
+            if connection is None:
+                connection = await asyncio.open_connection(host, port)
+            reader, writer = connection
+            writer.write(f'GET /metrics HTTP/1.1\r\nHost: {host}\r\n\r\n'.encode())
+            _, headers = await _read_headers(reader)
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+            for line in body.decode().splitlines():
+                if line.startswith('doorbell_heap_alloc_bytes '):
+                    samples.append(int(line.split()[1]))
+        except (ConnectionError, OSError, ValueError, asyncio.IncompleteReadError):
+            connection = None
+        await asyncio.sleep(0.5)
+    if connection:
+        connection[1].close()
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def _viewer_result(stats):
+    duration = stats['end'] - stats.get('start', stats['end'])
+    intervals = stats['intervals']
+    return {
+        'frames': stats['frames'],
+        'fps': round(len(intervals) / duration, 2) if duration > 0 else 0,
+        'jitter_ms': round(statistics.pstdev(intervals), 2) if len(intervals) > 1 else None,
+        'interval_p95_ms': round(_percentile(intervals, 0.95), 1) if intervals else None,
+        'ttff_ms': round(stats['ttff_ms'], 1) if stats['ttff_ms'] is not None else None,
+        'bytes_per_s': round(stats['bytes'] / duration) if duration > 0 else 0,
+        'error': stats['error'],
+    }
+
+def _mean(values):
+    values = [v for v in values if v is not None]
+    return round(statistics.mean(values), 2) if values else None
+
+async def _serve(args):
+    """
+    Runs the stream server on the fake camera until killed, for --serve.
+    """
+    import sim
+    sim.install(trace_heap=args.trace_heap)
+    sys.path.insert(0, os.path.join(root, 'libs'))
+    import config
+    from sim.camera import Camera
+    Camera.fps = args.fps
+    if args.pics:
+        Camera.replay(args.pics)
+    config.capture_thread = args.capture_thread
+
+    import stream_server
+    from static_files import StaticFile
+    # What stream_server_start() does, on a free port
+    stream_server.index_page = StaticFile(os.path.join(root, 'CameraSettings.html'), 'text/html')
+    server = await asyncio.start_server(stream_server.handle_client, '127.0.0.1', 0)
+    print(f"PORT {server.sockets[0].getsockname()[1]}", flush=True)
+    while True:
+        await asyncio.sleep(3600)
+
+async def _discard_output(stream):
+    while await stream.readline():
+        pass
+
+async def _start_local(args):
+    """
+    Starts the stream server on the fake camera in a child process.
+
+    Returns:
+        (process, port, task draining the server's output)
+    """
+    command = [sys.executable, os.path.abspath(__file__), '--serve', '--fps', str(args.fps)]
+    if args.pics:
+        command += ['--pics', args.pics]
+    if args.capture_thread:
+        command.append('--capture-thread')
+    if not args.trace_heap:
+        command.append('--no-trace-heap')
+    process = await asyncio.create_subprocess_exec(*command, stdout=asyncio.subprocess.PIPE,
+                                                   stderr=asyncio.subprocess.STDOUT)
+    while True:
+        line = await process.stdout.readline()
+        if not line:
+            raise RuntimeError("the server exited before it started listening")
+        if line.startswith(b'PORT '):
+            port = int(line.split()[1])
+            break
+    return process, port, asyncio.create_task(_discard_output(process.stdout))
+
+async def run(args):
+    host, port = args.host, args.port
+    process = None
+    if host is None:
+        host = '127.0.0.1'
+        process, port, output = await _start_local(args)
+    try:
+        return await _load(args, host, port)
+    finally:
+        if process:
+            process.kill()
+            await process.wait()
+            output.cancel()
+
+async def _load(args, host, port):
+    loop = asyncio.get_running_loop()
+    end = loop.time() + args.seconds
+    query = f'?fps={args.viewer_fps}' if args.viewer_fps else ''
+    viewers = [_viewer(host, port, '/stream' + query, end) for _ in range(args.viewers)]
+    control = [_requests(host, port, ('/get_quality', '/set_brightness?value=1', '/get_brightness'),
+                         args.control_interval, end, True) for _ in range(args.control_clients)]
+    index = [_requests(host, port, ('/',), args.index_interval, end, False) for _ in range(args.index_clients)]
+    heap = []
+    # Untraced, the fake camera's server reports a heap of 0
+    sampler = [_heap_sampler(host, port, heap, end)] if args.host or args.trace_heap else []
+
+    results = await asyncio.gather(*viewers, *control, *index, *sampler)
+    viewer_results = [_viewer_result(stats) for stats in results[:len(viewers)]]
+    control_results = results[len(viewers):len(viewers) + len(control)]
+    index_results = results[len(viewers) + len(control):len(viewers) + len(control) + len(index)]
+    control_ms = [ms for latencies, _ in control_results for ms in latencies]
+    index_ms = [ms for latencies, _ in index_results for ms in latencies]
+    # Steady state is the second half of the run, after the camera and buffers are set up
+    steady = heap[len(heap) // 2:]
+
+    return {
+        'version': args.label or _git_version(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'target': f'{args.host}:{args.port}' if args.host else 'sim',
+        'scenario': {
+            'viewers': args.viewers, 'viewer_fps': args.viewer_fps, 'seconds': args.seconds,
+            'control_clients': args.control_clients, 'index_clients': args.index_clients,
+            'camera_fps': None if args.host else args.fps,
+            'capture_thread': None if args.host else args.capture_thread,
+        },
+        'viewers': viewer_results,
+        'summary': {
+            'fps': _mean(v['fps'] for v in viewer_results),
+            'jitter_ms': _mean(v['jitter_ms'] for v in viewer_results),
+            'ttff_ms': _mean(v['ttff_ms'] for v in viewer_results),
+            'bytes_per_s': sum(v['bytes_per_s'] for v in viewer_results),
+            'control_requests': len(control_ms),
+            'control_errors': sum(errors for _, errors in control_results),
+            'control_p95_ms': _percentile(control_ms, 0.95) and round(_percentile(control_ms, 0.95), 1),
+            'index_requests': len(index_ms),
+            'index_errors': sum(errors for _, errors in index_results),
+            'index_p95_ms': _percentile(index_ms, 0.95) and round(_percentile(index_ms, 0.95), 1),
+            'heap_peak': max(heap) if heap else None,
+            'heap_steady': round(statistics.median(steady)) if steady else None,
+        },
+    }
+
+def _git_version():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=root, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _previous(path, result):
+    """
+    Returns the last run in the results file with the same target and scenario.
+    """
+    previous = None
+    try:
+        with open(path) as f:
+            for line in f:
+                record = json.loads(line)
+                if record['target'] == result['target'] and record['scenario'] == result['scenario']:
+                    previous = record
+    except FileNotFoundError:
+        pass
+    return previous
+
+def _report(result, previous):
+    print(f"{'viewer':>6s} {'frames':>6s} {'fps':>6s} {'jitter':>7s} {'p95 ms':>7s} {'ttff ms':>8s} {'KB/s':>8s}")
+    for i, v in enumerate(result['viewers']):
+        print(f"{i:>6d} {v['frames']:>6d} {v['fps']:>6.1f} {v['jitter_ms'] or 0:>7.1f} "
+              f"{v['interval_p95_ms'] or 0:>7.1f} {v['ttff_ms'] or 0:>8.1f} {v['bytes_per_s'] / 1024:>8.1f}"
+              f"{'  ' + v['error'] if v['error'] else ''}")
+    print()
+    for name, value in result['summary'].items():
+        line = f"{name:18s} {value}"
+        if previous and name in dict(_COMPARED):
+            old = previous['summary'].get(name)
+            if old and value is not None:
+                change = (value - old) * 100 / old
+                worse = abs(change) >= _WORSE_PERCENT and (change > 0) != dict(_COMPARED)[name]
+                line += f"  ({change:+.1f}% vs {previous['version']}{', worse' if worse else ''})"
+        print(line)
+
+def main(args):
+    if args.serve:
+        asyncio.run(_serve(args))
+        return True
+    result = asyncio.run(run(args))
+    previous = _previous(args.output, result) if args.output else None
+    _report(result, previous)
+    if args.output:
+        with open(args.output, 'a') as f:
+            f.write(json.dumps(result) + '\n')
+    return all(v['error'] is None and v['frames'] for v in result['viewers'])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', help="device to test, the fake camera in a child process if not given")
+    parser.add_argument('--port', type=int, default=80)
+    parser.add_argument('--viewers', type=int, default=2)
+    parser.add_argument('--viewer-fps', type=int, help="fps cap the viewers ask for")
+    parser.add_argument('--control-clients', type=int, default=1)
+    parser.add_argument('--control-interval', type=float, default=0.5, help="seconds between /get_ and /set_ requests")
+    parser.add_argument('--index-clients', type=int, default=1)
+    parser.add_argument('--index-interval', type=float, default=2, help="seconds between settings page loads")
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--fps', type=int, default=25, help="fake camera frame rate")
+    parser.add_argument('--pics', help="JPEGs the fake camera replays instead of synthetic frames")
+    parser.add_argument('--capture-thread', action='store_true', help="capture in a thread, as config.capture_thread")
+    parser.add_argument('--no-trace-heap', dest='trace_heap', action='store_false',
+                        help="don't trace the heap, faster but without heap numbers")
+    parser.add_argument('--label', help="version recorded with the results, git describe by default")
+    parser.add_argument('--output', help="JSON lines file the results are appended to")
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    sys.exit(0 if main(parser.parse_args()) else 1)
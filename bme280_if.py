@@ -1,44 +1,172 @@
 from bme280 import bme280
+from bmp280 import bmp280
 import machine
 import config
+from array import array
+
+# Chip ID register and the IDs of the supported sensors, early BMP280
+# samples report 0x56 or 0x57
+_CHIP_ID_REG = 0xD0
+_CHIP_IDS = {0x60: 'bme280', 0x58: 'bmp280', 0x57: 'bmp280', 0x56: 'bmp280'}
+_ADDRESSES = (0x76, 0x77)
+
+# Calibration coefficients of the sensor, saved on the first boot:
+# chip ID, address, then the calibration block
+CAL_FILE = 'sensor_cal.bin'
+# Size of the calibration block each driver reads, config.sens_chip can pick
+# the BMP280 driver for a BME280 and the other way round
+_BME280_CAL_SIZE = 33
+_BMP280_CAL_SIZE = 24
+
+sensor = None
+# 'bme280' or 'bmp280' once the sensor is initialized
+chip = None
+
+# Compensated readings, reused for every read
+_result = array("i", [0, 0, 0])
+
+def has_humidity():
+    """
+    Whether the sensor measures humidity, a BMP280 doesn't.
+    """
+    return chip == 'bme280'
+
+def _open_bus():
+    pinSDA = machine.Pin(config.SDA_pin)
+    pinSCL = machine.Pin(config.SCL_pin)
+
+    if config.i2c_id is not None:
+        try:
+            return machine.I2C(config.i2c_id, scl=pinSCL, sda=pinSDA, freq=config.i2c_freq)
+        except (ValueError, OSError) as e:
+            print(f"Hardware I2C {config.i2c_id} unavailable ({e}), using SoftI2C")
+
+    return machine.SoftI2C(scl=pinSCL, sda=pinSDA, freq=config.i2c_freq)
+
+def detect(i2c):
+    """
+    Looks for a BME280 or BMP280 at both of their addresses.
+
+    Only reads the chip ID register at 0x76 and 0x77 instead of scanning the
+    whole bus, which takes over a hundred transactions.
+
+    Returns:
+        A tuple of the address and chip ID, (None, None) if there is no sensor.
+    """
+    for address in _ADDRESSES:
+        try:
+            chip_id = i2c.readfrom_mem(address, _CHIP_ID_REG, 1)[0]
+        except OSError:
+            continue
+        if chip_id in _CHIP_IDS:
+            return address, chip_id
+    return None, None
+
+def _load_calibration(i2c, address, chip_id, size):
+    try:
+        with open(CAL_FILE, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    # Saved by the other driver if the size doesn't match
+    if len(data) != 2 + size or data[0] != chip_id or data[1] != address:
+        return None
+    # A different sensor of the same type would have other coefficients,
+    # dig_T1 is enough to tell
+    if i2c.readfrom_mem(address, 0x88, 2) != data[2:4]:
+        return None
+    return data[2:]
+
+def _save_calibration(address, chip_id, calibration):
+    try:
+        with open(CAL_FILE, 'wb') as f:
+            f.write(bytes((chip_id, address)))
+            f.write(calibration)
+    except OSError as e:
+        print(f"Couldn't cache the sensor calibration: {e}")
 
 def sensor_init():
     """
-    Initialize the BME280 sensor.
+    Initialize the BME280 (or BMP280) sensor.
 
     This function should be called once in the module's __init__ method to
-    initialize the sensor. It sets up the I2C pins and creates an instance of
-    the BME280 class.
+    initialize the sensor. It opens the I2C bus, on the hardware peripheral
+    if possible, finds the sensor at 0x76 or 0x77 and creates an instance of
+    the driver for its chip ID. The calibration is read from CAL_FILE when
+    it was saved for this sensor before.
+
+    Raises:
+        OSError: If no sensor was found.
     """
-    global sensor
-    
+    global sensor, chip
+
     print("Initializing sensor.")
 
-    pinSDA = machine.Pin(config.SDA_pin)
-    pinSCL = machine.Pin(config.SCL_pin)
+    i2c = _open_bus()
+    address, chip_id = detect(i2c)
+    if address is None:
+        raise OSError("no BME280/BMP280 at 0x76 or 0x77")
+    chip = chip_name(chip_id)
+    print(f"Found {chip} (chip ID 0x{chip_id:02x}) at 0x{address:02x}")
+    sensor = _open_sensor(i2c, address, chip_id, chip)
+
+def chip_name(chip_id):
+    """
+    Returns the driver to use for a sensor with `chip_id`, 'bme280' or
+    'bmp280', unless config.sens_chip forces one.
+    """
+    return _CHIP_IDS[chip_id] if config.sens_chip == 'auto' else config.sens_chip
 
-    i2c = machine.SoftI2C(scl=pinSCL, sda=pinSDA)
+def _open_sensor(i2c, address, chip_id, chip, cached=True):
+    """
+    Creates the `chip` driver for the sensor, with the calibration from
+    CAL_FILE if it was saved for this sensor and driver before, otherwise
+    read from the sensor and saved. `cached=False` ignores CAL_FILE.
+    """
+    cal_size = _BMP280_CAL_SIZE if chip == 'bmp280' else _BME280_CAL_SIZE
+    calibration = _load_calibration(i2c, address, chip_id, cal_size) if cached else None
+    if chip == 'bmp280':
+        # Measures on demand, reads both values in one burst
+        sensor = bmp280.BMP280(i2c, address, use_case=None, calibration=calibration)
+        sensor.forced_mode(bmp280.BMP280_OS_STANDARD)
+    else:
+        sensor = bme280.BME280(address=address, i2c=i2c, calibration=calibration)
+        if config.sens_normal_mode:
+            # Measures continuously with IIR filtering, reads return immediately
+            sensor.set_normal_mode(bme280.BME280_STANDBY_1000, bme280.BME280_IIR_FILTER_4)
 
-    sensor = bme280.BME280(i2c=i2c)
+    if calibration is None:
+        _save_calibration(address, chip_id, sensor.calibration)
+    return sensor
 
-def read_sensor():
+async def read_sensor():
     """
     Read the temperature, pressure, and humidity from the BME280 sensor.
 
+    Awaits the sensor's conversion time instead of blocking, so the other
+    tasks (the video stream) keep running while it measures. Compensation
+    uses the sensor's 32-bit formulas into a preallocated array, so a reading
+    doesn't allocate; format the values with hundredths() only when needed.
+
     Returns:
-        A tuple containing the temperature, pressure, and humidity in that order.
+        A tuple containing the temperature (0.01 °C), pressure (0.01 hPa) and
+        humidity (0.01 %, 0 on a BMP280) in that order, as integers.
     """
     if sensor is None:
         raise ValueError("Sensor not initialized. Call sensor_init() first.")
 
-    t, p, h = sensor.read_compensated_data()
+    if not has_humidity():
+        t, p, _ = await sensor.measure_async(_result)
+        return t, p, 0
+
+    t, p, h = await sensor.read_int32_async(_result)
 
-    p = p // 256
-    pi = p // 100
-    pd = p - pi * 100
-    hi = h // 1024
-    hd = h * 100 // 1024 - hi * 100
+    return t, p, h * 100 >> 10
 
-    
-    return ("{}".format(t / 100), "{}.{:02d}".format(pi, pd),
-            "{}.{:02d}".format(hi, hd))
+def hundredths(value):
+    """
+    Formats an integer in hundredths as a decimal number, e.g. -305 as "-3.05".
+    """
+    if value < 0:
+        return "-{}.{:02d}".format(-value // 100, -value % 100)
+    return "{}.{:02d}".format(value // 100, value % 100)
@@ -0,0 +1,112 @@
+import _thread
+import asyncio
+
+class FrameGrabber:
+    """
+    Captures frames in a separate thread and hands the newest one to asyncio.
+
+    cam.capture() is synchronous, so in the capture loop it blocks every other
+    task until the frame is ready. Here a `_thread` worker captures instead
+    and the asyncio side only picks up completed frames.
+
+    The worker stores a captured frame in a back slot and, under the lock,
+    makes it the front one and bumps the sequence number. The asyncio side
+    only reads the front slot under the same lock, so it never sees a
+    half-published frame. Frames replaced before asyncio took them are
+    counted as missed.
+
+    The driver reuses its frame buffer once the worker captures the next
+    frame, which it does right after publishing one. So the worker copies
+    each frame into one of three reused buffers of its own, never into the
+    front one or the one asyncio took last. A frame returned by next_frame()
+    or latest() stays intact until the next call to either of them, copy it
+    to keep it for longer.
+
+    How much actually runs in parallel depends on the port and on the camera
+    driver releasing the GIL while it waits for a frame.
+
+    Args:
+        cam: An initialized Camera object.
+    """
+    def __init__(self, cam):
+        self.cam = cam
+        self.running = False
+        self.frames_captured = 0
+        self.frames_missed = 0
+        self._lock = _thread.allocate_lock()
+        self._buffers = [bytearray(), bytearray(), bytearray()]
+        self._frames = [None, None, None]
+        self._front = 0
+        # Slot of the frame asyncio took last
+        self._held = 0
+        self._seq = 0
+        self._taken = 0
+        self._done = True
+        self._flag = asyncio.ThreadSafeFlag()
+
+    def start(self):
+        self.running = True
+        self._done = False
+        _thread.start_new_thread(self._run, ())
+
+    async def stop(self):
+        """
+        Stops the worker and waits until it has finished its last capture.
+        """
+        self.running = False
+        while not self._done:
+            await asyncio.sleep_ms(10)
+
+    def _run(self):
+        try:
+            while self.running:
+                frame = self.cam.capture()
+                if not frame:
+                    continue
+
+                # Neither the published frame nor the one asyncio holds
+                with self._lock:
+                    back = 3 - self._front - self._held if self._front != self._held else (self._front + 1) % 3
+                buffer = self._buffers[back]
+                if len(buffer) < len(frame):
+                    # With some headroom, the frames vary in size
+                    buffer = self._buffers[back] = bytearray(len(frame) + len(frame) // 8)
+                view = memoryview(buffer)[:len(frame)]
+                view[:] = frame
+                self._frames[back] = view
+                with self._lock:
+                    self._front = back
+                    self._seq += 1
+                self.frames_captured += 1
+                self._flag.set()
+        except Exception as e:
+            print(f"Capture thread error: {e}")
+        finally:
+            self.running = False
+            self._done = True
+            self._flag.set()
+
+    def latest(self):
+        """
+        Returns the newest completed frame without taking it from next_frame().
+        """
+        with self._lock:
+            self._held = self._front
+            return self._frames[self._front]
+
+    async def next_frame(self):
+        """
+        Waits for a frame newer than the last one taken and returns it.
+
+        Returns None once the worker has stopped.
+        """
+        while True:
+            with self._lock:
+                if self._seq != self._taken:
+                    self.frames_missed += self._seq - self._taken - 1
+                    self._taken = self._seq
+                    self._held = self._front
+                    return self._frames[self._front]
+            if self._done:
+                return None
+            await self._flag.wait()
@@ -7,8 +7,46 @@ MQTT_CLIENT_ID = 'name_of_your_device'
 # BME280 pins
 SDA_pin = 42
 SCL_pin = 1
+# Hardware I2C peripheral, None to always bit-bang the bus with SoftI2C
+i2c_id = 0
+i2c_freq = 400000
+# 'auto' picks the driver by chip ID, or force 'bme280' / 'bmp280'
+sens_chip = 'auto'
 
 bell_pin = 47
 dbnc_delay = 200
-sens_t = 30
+# Sensor reporting: sample every sens_t seconds, average the last sens_avg
+# samples and publish when an average moves by its deadband (temperature,
+# pressure, humidity in hundredths of °C, hPa, %) or every sens_heartbeat_t
+sens_t = 10
+sens_avg = 4
+sens_deadband = (20, 50, 100)
+sens_heartbeat_t = 600
+# Let the BME280 measure continuously instead of triggering each reading
+sens_normal_mode = False
 
+# Garbage collection: collect between frames and sensor cycles once about
+# gc_period_ms worth of allocations piled up, or less than gc_min_free bytes
+# are free. Automatic collections only kick in at twice that.
+gc_period_ms = 1000
+gc_min_free = 256 * 1024
+
+# Log tasks that keep the event loop from running others for longer than
+# loop_warn_ms, and let the watchdog reset the board when it is stuck for
+# wdt_timeout_s seconds (0 disables the watchdog)
+loop_warn_ms = 100
+wdt_timeout_s = 0
+
+# Camera
+# Port of the web UI and stream server
+http_port = 80
+cam_idle_t = 60
+snap_max_age_ms = 1000
+# Capture frames in a separate thread
+capture_thread = False
+
+# Adaptive stream quality
+adapt_quality = True
+adapt_frame_size = False
+target_fps = 10
+min_quality = 20
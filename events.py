@@ -0,0 +1,52 @@
+import asyncio
+from array import array
+
+class EventRing:
+    """
+    Fixed-size ring buffer of event timestamps, filled from interrupt context.
+
+    put() neither allocates nor blocks, so it can be called straight from a
+    pin IRQ handler. It wakes the consumer through a ThreadSafeFlag, so the
+    consumer doesn't have to poll. When the ring is full new events are
+    dropped and counted in `overflows`.
+
+    Args:
+        size: Number of slots, one less event than that can be pending.
+    """
+    def __init__(self, size=8):
+        self._buf = array('i', [0] * size)
+        self._size = size
+        self._head = 0
+        self._tail = 0
+        self.overflows = 0
+        self.flag = asyncio.ThreadSafeFlag()
+
+    def put(self, value):
+        head = self._head + 1
+        if head == self._size:
+            head = 0
+        if head == self._tail:
+            self.overflows += 1
+            return
+        self._buf[self._head] = value
+        self._head = head
+        self.flag.set()
+
+    def pending(self):
+        return self._head != self._tail
+
+    def get(self):
+        """
+        Returns the oldest pending event, check pending() first.
+        """
+        value = self._buf[self._tail]
+        tail = self._tail + 1
+        self._tail = 0 if tail == self._size else tail
+        return value
+
+    async def wait(self):
+        """
+        Waits until at least one event is pending.
+        """
+        while not self.pending():
+            await self.flag.wait()
@@ -0,0 +1,189 @@
+"""
+Streaming HTTP/1.1 request parser and response headers.
+
+read_request() reads the request line and headers line by line from an
+asyncio stream, then the body if there is one, so requests split over
+several TCP segments or longer than one read are parsed the same as small
+ones. It works on bytes and only
+decodes what the handlers use: the path, the query parameters (parsed once)
+and the headers listed in HEADERS.
+"""
+
+# Longest request line or header line accepted
+MAX_LINE = 1024
+# Most header lines accepted in one request
+MAX_HEADERS = 64
+# Largest request body accepted
+MAX_BODY = 2048
+
+# Headers kept in Request.headers, others are skipped without decoding
+HEADERS = (b'connection', b'content-length', b'if-none-match', b'accept-encoding')
+
+class HTTPError(Exception):
+    """
+    The request can't be served, `status` is the response status line.
+    """
+    def __init__(self, status):
+        super().__init__(status)
+        self.status = status
+
+class Request:
+    """
+    A parsed request.
+
+    Attributes:
+        method: Request method, e.g. 'GET'.
+        path: Path without the query string.
+        query: Dict of the query parameters, as strings.
+        headers: Dict of the HEADERS that were sent, lower case names, string values.
+        version: 'HTTP/1.1' or 'HTTP/1.0'.
+        body: The request body, b'' if there is none.
+        keep_alive: Whether the client wants to reuse the connection.
+    """
+    def __init__(self, method, path, query, version):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.version = version
+        self.headers = {}
+        self.body = b''
+        self.keep_alive = False
+
+    def query_int(self, name, default=None):
+        """
+        Returns the query parameter `name` as an int, or default if it is missing or not a number.
+        """
+        value = self.query.get(name)
+        if value is None:
+            return default
+        try:
+            return int(value)
+        except ValueError:
+            return default
+
+def _unquote(value):
+    if b'%' not in value and b'+' not in value:
+        return value.decode()
+    value = value.replace(b'+', b' ')
+    out = bytearray()
+    i = 0
+    while i < len(value):
+        if value[i] == 0x25 and i + 2 < len(value):  # '%'
+            try:
+                out.append(int(value[i + 1:i + 3].decode(), 16))
+                i += 3
+                continue
+            except ValueError:
+                pass
+        out.append(value[i])
+        i += 1
+    return bytes(out).decode()
+
+def parse_query(query):
+    """
+    Parses a query string (bytes) into a dict of strings.
+    """
+    params = {}
+    if query:
+        for pair in query.split(b'&'):
+            key, _, value = pair.partition(b'=')
+            if key:
+                params[_unquote(key)] = _unquote(value)
+    return params
+
+def parse_request_line(line):
+    """
+    Parses a request line like b'GET /stream?fps=5 HTTP/1.1\\r\\n'.
+
+    Raises:
+        HTTPError: If the line isn't a valid HTTP/1.x request line.
+    """
+    parts = line.split()
+    if len(parts) != 3 or not parts[2].startswith(b'HTTP/1.'):
+        raise HTTPError('400 Bad Request')
+    method, target, version = parts
+    path, _, query = target.partition(b'?')
+    return Request(method.decode(), _unquote(path), parse_query(query), version.decode())
+
+def parse_header(line, request):
+    """
+    Adds the header in `line` to request.headers if it is one of HEADERS.
+    """
+    colon = line.find(b':')
+    if colon <= 0:
+        raise HTTPError('400 Bad Request')
+    name = line[:colon].lower()
+    if name in HEADERS:
+        request.headers[name.decode()] = line[colon + 1:].strip().decode()
+
+async def _readline(reader):
+    line = await reader.readline()
+    if len(line) > MAX_LINE:
+        raise HTTPError('431 Request Header Fields Too Large')
+    return line
+
+async def read_request(reader):
+    """
+    Reads the next request from the stream.
+
+    Returns:
+        The Request, or None if the client closed the connection before sending one.
+
+    Raises:
+        HTTPError: If the request is malformed or too large.
+    """
+    line = await _readline(reader)
+    # Tolerate empty lines between requests, as RFC 9112 asks
+    while line in (b'\r\n', b'\n'):
+        line = await _readline(reader)
+    if not line:
+        return None
+    request = parse_request_line(line)
+
+    for _ in range(MAX_HEADERS):
+        line = await _readline(reader)
+        if not line:
+            raise HTTPError('400 Bad Request')
+        if line in (b'\r\n', b'\n'):
+            break
+        parse_header(line, request)
+    else:
+        raise HTTPError('431 Request Header Fields Too Large')
+
+    # Persistent by default in HTTP/1.1, on request in HTTP/1.0
+    connection = request.headers.get('connection', '').lower()
+    if request.version == 'HTTP/1.1':
+        request.keep_alive = connection != 'close'
+    else:
+        request.keep_alive = connection == 'keep-alive'
+
+    length = request.headers.get('content-length')
+    if length:
+        try:
+            length = int(length)
+        except ValueError:
+            raise HTTPError('400 Bad Request')
+        if length > MAX_BODY:
+            raise HTTPError('413 Content Too Large')
+        request.body = await reader.readexactly(length)
+    return request
+
+def response_header(request, status, length, content_type=None, headers=''):
+    """
+    Returns the header of a response with `length` bytes of body.
+
+    Every response has a Content-Length, so the connection can be reused.
+    """
+    connection = 'keep-alive' if request.keep_alive else 'close'
+    if content_type:
+        headers += f'Content-Type: {content_type}\r\n'
+    return f'HTTP/1.1 {status}\r\nContent-Length: {length}\r\nConnection: {connection}\r\n{headers}\r\n'.encode()
+
+def not_modified(request, etag):
+    """
+    Returns the 304 response if the client's cached copy has `etag`, else None.
+    """
+    if etag not in request.headers.get('if-none-match', ''):
+        return None
+    connection = 'keep-alive' if request.keep_alive else 'close'
+    return f'HTTP/1.1 304 Not Modified\r\nETag: {etag}\r\nConnection: {connection}\r\n\r\n'.encode()
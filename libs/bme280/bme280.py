@@ -33,6 +33,7 @@
 # THE SOFTWARE.
 
 import time
+import asyncio
 from ustruct import unpack, unpack_from
 from array import array
 
@@ -48,6 +49,24 @@ BME280_OSAMPLE_16 = 5
 
 BME280_REGISTER_CONTROL_HUM = 0xF2
 BME280_REGISTER_CONTROL = 0xF4
+BME280_REGISTER_CONFIG = 0xF5
+
+# Standby time between measurements in normal mode
+BME280_STANDBY_0_5 = 0
+BME280_STANDBY_62_5 = 1
+BME280_STANDBY_125 = 2
+BME280_STANDBY_250 = 3
+BME280_STANDBY_500 = 4
+BME280_STANDBY_1000 = 5
+BME280_STANDBY_10 = 6
+BME280_STANDBY_20 = 7
+
+# IIR filter coefficient
+BME280_IIR_FILTER_OFF = 0
+BME280_IIR_FILTER_2 = 1
+BME280_IIR_FILTER_4 = 2
+BME280_IIR_FILTER_8 = 3
+BME280_IIR_FILTER_16 = 4
 
 
 class BME280:
@@ -56,6 +75,7 @@ class BME280:
                  mode=BME280_OSAMPLE_1,
                  address=BME280_I2CADDR,
                  i2c=None,
+                 calibration=None,
                  **kwargs):
         # Check that mode is valid.
         if mode not in [BME280_OSAMPLE_1, BME280_OSAMPLE_2, BME280_OSAMPLE_4,
@@ -70,9 +90,14 @@ class BME280:
             raise ValueError('An I2C object is required.')
         self.i2c = i2c
 
-        # load calibration data
-        dig_88_a1 = self.i2c.readfrom_mem(self.address, 0x88, 26)
-        dig_e1_e7 = self.i2c.readfrom_mem(self.address, 0xE1, 7)
+        # load calibration data, unless the caller has it cached from the
+        # `calibration` attribute of an earlier instance
+        if calibration is None:
+            calibration = (self.i2c.readfrom_mem(self.address, 0x88, 26) +
+                           self.i2c.readfrom_mem(self.address, 0xE1, 7))
+        self.calibration = calibration
+        dig_88_a1 = calibration[:26]
+        dig_e1_e7 = calibration[26:]
         self.dig_T1, self.dig_T2, self.dig_T3, self.dig_P1, \
             self.dig_P2, self.dig_P3, self.dig_P4, self.dig_P5, \
             self.dig_P6, self.dig_P7, self.dig_P8, self.dig_P9, \
@@ -90,34 +115,61 @@ class BME280:
         self.i2c.writeto_mem(self.address, BME280_REGISTER_CONTROL,
                              bytearray([0x3F]))
         self.t_fine = 0
+        # in normal mode the sensor measures on its own, reads don't trigger
+        self._normal_mode = False
 
         # temporary data holders which stay allocated
         self._l1_barray = bytearray(1)
         self._l8_barray = bytearray(8)
         self._l3_resultarray = array("i", [0, 0, 0])
 
-    def read_raw_data(self, result):
-        """ Reads the raw (uncompensated) data from the sensor.
+    def set_normal_mode(self, standby=BME280_STANDBY_1000,
+                        iir=BME280_IIR_FILTER_OFF):
+        """ Lets the sensor measure continuously on its own.
+
+            Reads then return the latest measurement right away instead of
+            triggering one and waiting for it.
 
             Args:
-                result: array of length 3 or alike where the result will be
-                stored, in temperature, pressure, humidity order
-            Returns:
-                None
+                standby: one of the BME280_STANDBY_* times between
+                measurements
+                iir: one of the BME280_IIR_FILTER_* coefficients
         """
-
+        # config is only reliably written in sleep mode
+        self._l1_barray[0] = 0
+        self.i2c.writeto_mem(self.address, BME280_REGISTER_CONTROL,
+                             self._l1_barray)
+        self._l1_barray[0] = standby << 5 | iir << 2
+        self.i2c.writeto_mem(self.address, BME280_REGISTER_CONFIG,
+                             self._l1_barray)
         self._l1_barray[0] = self._mode
         self.i2c.writeto_mem(self.address, BME280_REGISTER_CONTROL_HUM,
                              self._l1_barray)
-        self._l1_barray[0] = self._mode << 5 | self._mode << 2 | 1
+        self._l1_barray[0] = self._mode << 5 | self._mode << 2 | 3
         self.i2c.writeto_mem(self.address, BME280_REGISTER_CONTROL,
                              self._l1_barray)
+        self._normal_mode = True
 
+    def set_forced_mode(self):
+        """ Goes back to triggering a measurement on every read. """
+        self._normal_mode = False
+
+    def measurement_time_us(self):
+        """ Returns the maximum duration of one forced measurement. """
         sleep_time = 1250 + 2300 * (1 << self._mode)
         sleep_time = sleep_time + 2300 * (1 << self._mode) + 575
         sleep_time = sleep_time + 2300 * (1 << self._mode) + 575
-        time.sleep_us(sleep_time)  # Wait the required time
+        return sleep_time
+
+    def _trigger_measurement(self):
+        self._l1_barray[0] = self._mode
+        self.i2c.writeto_mem(self.address, BME280_REGISTER_CONTROL_HUM,
+                             self._l1_barray)
+        self._l1_barray[0] = self._mode << 5 | self._mode << 2 | 1
+        self.i2c.writeto_mem(self.address, BME280_REGISTER_CONTROL,
+                             self._l1_barray)
 
+    def _read_raw_into(self, result):
         # burst readout from 0xF7 to 0xFE, recommended by datasheet
         self.i2c.readfrom_mem_into(self.address, 0xF7, self._l8_barray)
         readout = self._l8_barray
@@ -132,6 +184,34 @@ class BME280:
         result[1] = raw_press
         result[2] = raw_hum
 
+    def read_raw_data(self, result):
+        """ Reads the raw (uncompensated) data from the sensor.
+
+            Blocks for the conversion time, see read_raw_data_async() for
+            a version that doesn't.
+
+            Args:
+                result: array of length 3 or alike where the result will be
+                stored, in temperature, pressure, humidity order
+            Returns:
+                None
+        """
+        if not self._normal_mode:
+            self._trigger_measurement()
+            time.sleep_us(self.measurement_time_us())  # Wait the required time
+
+        self._read_raw_into(result)
+
+    async def read_raw_data_async(self, result):
+        """ Like read_raw_data(), but awaits the conversion time instead of
+            blocking, so other tasks keep running while the sensor measures.
+        """
+        if not self._normal_mode:
+            self._trigger_measurement()
+            await asyncio.sleep_ms((self.measurement_time_us() + 999) // 1000)
+
+        self._read_raw_into(result)
+
     def read_compensated_data(self, result=None):
         """ Reads the data from the sensor and returns the compensated data.
 
@@ -145,9 +225,36 @@ class BME280:
                 the result parameter if not None
         """
         self.read_raw_data(self._l3_resultarray)
-        raw_temp, raw_press, raw_hum = self._l3_resultarray
+        return self.compensate(self._l3_resultarray, result)
+
+    async def read_compensated_data_async(self, result=None):
+        """ Like read_compensated_data(), but doesn't block while the sensor
+            measures.
+        """
+        await self.read_raw_data_async(self._l3_resultarray)
+        return self.compensate(self._l3_resultarray, result)
+
+    async def read_int32_async(self, result):
+        """ Like read_compensated_data_async(), but compensates with
+            compensate_int32(), so the pressure is in Pa.
+        """
+        await self.read_raw_data_async(self._l3_resultarray)
+        return self.compensate_int32(self._l3_resultarray, result)
+
+    def compensate(self, raw, result=None):
+        """ Reference compensation, the 64-bit formulas from the datasheet.
+
+            Args:
+                raw: raw temperature, pressure, humidity readings
+                result: optional array of length 3 for the result
+
+            Returns:
+                array with temperature in 0.01 degC, pressure in Q24.8 Pa and
+                humidity in Q22.10 %RH
+        """
+        raw_temp, raw_press, raw_hum = raw
         # temperature
-        var1 = ((raw_temp >> 3) - (self.dig_T1 << 1)) * (self.dig_T2 >> 11)
+        var1 = (((raw_temp >> 3) - (self.dig_T1 << 1)) * self.dig_T2) >> 11
         var2 = (((((raw_temp >> 4) - self.dig_T1) *
                   ((raw_temp >> 4) - self.dig_T1)) >> 12) * self.dig_T3) >> 14
         self.t_fine = var1 + var2
@@ -171,6 +278,79 @@ class BME280:
             pressure = ((p + var1 + var2) >> 8) + (self.dig_P7 << 4)
 
         # humidity
+        humidity = self._compensate_humidity(raw_hum)
+
+        if result:
+            result[0] = temp
+            result[1] = pressure
+            result[2] = humidity
+            return result
+
+        return array("i", (temp, pressure, humidity))
+
+    def compensate_int32(self, raw, result=None):
+        """ Compensation with the 32-bit formulas from the datasheet.
+
+            For sensor readings in the operating range every intermediate
+            value fits a MicroPython small int, so with a result array this
+            doesn't allocate. Temperature and humidity equal compensate(),
+            the pressure has 1 Pa resolution and rounds earlier, so it can be
+            a few Pa off the reference.
+
+            Args:
+                raw: raw temperature, pressure, humidity readings
+                result: optional array of length 3 for the result
+
+            Returns:
+                array with temperature in 0.01 degC, pressure in Pa and
+                humidity in Q22.10 %RH
+        """
+        raw_temp, raw_press, raw_hum = raw
+        # temperature
+        var1 = (((raw_temp >> 3) - (self.dig_T1 << 1)) * self.dig_T2) >> 11
+        var2 = (raw_temp >> 4) - self.dig_T1
+        var2 = (((var2 * var2) >> 12) * self.dig_T3) >> 14
+        t_fine = var1 + var2
+        self.t_fine = t_fine
+        temp = (t_fine * 5 + 128) >> 8
+
+        # pressure
+        var1 = (t_fine >> 1) - 64000
+        var2 = (((var1 >> 2) * (var1 >> 2)) >> 11) * self.dig_P6
+        var2 = var2 + ((var1 * self.dig_P5) << 1)
+        var2 = (var2 >> 2) + (self.dig_P4 << 16)
+        var1 = (((self.dig_P3 * (((var1 >> 2) * (var1 >> 2)) >> 13)) >> 3) +
+                ((self.dig_P2 * var1) >> 1)) >> 18
+        var1 = ((32768 + var1) * self.dig_P1) >> 15
+        if var1 == 0:
+            pressure = 0
+        else:
+            # p * 3125 would leave the small int range, so the division is
+            # split into quotient and remainder. The two branches round like
+            # the unsigned 32-bit code in the datasheet.
+            p = 1048576 - raw_press - (var2 >> 12)
+            if p < 687195:
+                q = p // var1
+                p = q * 6250 + (p - q * var1) * 6250 // var1
+            else:
+                q = p // var1
+                p = (q * 3125 + (p - q * var1) * 3125 // var1) << 1
+            var1 = (self.dig_P9 * (((p >> 3) * (p >> 3)) >> 13)) >> 12
+            var2 = ((p >> 2) * self.dig_P8) >> 13
+            pressure = p + ((var1 + var2 + self.dig_P7) >> 4)
+
+        # humidity, the reference already uses the 32-bit formula
+        humidity = self._compensate_humidity(raw_hum)
+
+        if result:
+            result[0] = temp
+            result[1] = pressure
+            result[2] = humidity
+            return result
+
+        return array("i", (temp, pressure, humidity))
+
+    def _compensate_humidity(self, raw_hum):
         h = self.t_fine - 76800
         h = (((((raw_hum << 14) - (self.dig_H4 << 20) -
                 (self.dig_H5 * h)) + 16384)
@@ -180,15 +360,7 @@ class BME280:
         h = h - (((((h >> 15) * (h >> 15)) >> 7) * self.dig_H1) >> 4)
         h = 0 if h < 0 else h
         h = 419430400 if h > 419430400 else h
-        humidity = h >> 12
-
-        if result:
-            result[0] = temp
-            result[1] = pressure
-            result[2] = humidity
-            return result
-
-        return array("i", (temp, pressure, humidity))
+        return h >> 12
 
     @property
     def values(self):
@@ -1,3 +1,5 @@
+import time
+import asyncio
 from micropython import const
 from ustruct import unpack as unp
 
@@ -86,26 +88,21 @@ _BMP280_REGISTER_DATA = const(0xF7)
 
 
 class BMP280:
-    def __init__(self, i2c_bus, addr=0x76, use_case=BMP280_CASE_HANDHELD_DYN):
+    def __init__(self, i2c_bus, addr=0x76, use_case=BMP280_CASE_HANDHELD_DYN, calibration=None):
         self._bmp_i2c = i2c_bus
         self._i2c_addr = addr
 
-        # read calibration data
+        # read calibration data in one burst, unless the caller has it cached
+        # from the `calibration` attribute of an earlier instance
         # < little-endian
         # H unsigned short
         # h signed short
-        self._T1 = unp('<H', self._read(0x88, 2))[0]
-        self._T2 = unp('<h', self._read(0x8A, 2))[0]
-        self._T3 = unp('<h', self._read(0x8C, 2))[0]
-        self._P1 = unp('<H', self._read(0x8E, 2))[0]
-        self._P2 = unp('<h', self._read(0x90, 2))[0]
-        self._P3 = unp('<h', self._read(0x92, 2))[0]
-        self._P4 = unp('<h', self._read(0x94, 2))[0]
-        self._P5 = unp('<h', self._read(0x96, 2))[0]
-        self._P6 = unp('<h', self._read(0x98, 2))[0]
-        self._P7 = unp('<h', self._read(0x9A, 2))[0]
-        self._P8 = unp('<h', self._read(0x9C, 2))[0]
-        self._P9 = unp('<h', self._read(0x9E, 2))[0]
+        if calibration is None:
+            calibration = self._read(0x88, 24)
+        self.calibration = calibration
+        self._T1, self._T2, self._T3, self._P1, self._P2, self._P3, \
+            self._P4, self._P5, self._P6, self._P7, self._P8, \
+            self._P9 = unp('<HhhHhhhhhhhh', calibration)
 
         # output raw
         self._t_raw = 0
@@ -119,9 +116,14 @@ class BMP280:
         self._new_read_ms = 200  # interval between
         self._last_read_ts = 0
 
-        if use_case is None:
+        if use_case is not None:
             self.use_case(use_case)
 
+        # used by measure(), stay allocated
+        self._ctrl_forced = BMP280_POWER_FORCED + (BMP280_PRES_OS_4 << 2) + (BMP280_TEMP_OS_1 << 5)
+        self._ctrl_buf = bytearray(1)
+        self._data_buf = bytearray(6)
+
     def _read(self, addr, size=1):
         return self._bmp_i2c.readfrom_mem(self._i2c_addr, addr, size)
 
@@ -219,6 +221,82 @@ class BMP280:
             self._p = p / 256.0
         return self._p
 
+    def forced_mode(self, oss=BMP280_OS_STANDARD, iir=BMP280_IIR_FILTER_OFF):
+        """
+        Configures the sensor for measure(), which triggers one measurement
+        per call and lets the sensor sleep in between.
+        """
+        assert 0 <= oss <= 4
+        p_os, t_os, self.read_wait_ms = _BMP280_OS_MATRIX[oss]
+        self._ctrl_forced = BMP280_POWER_FORCED + (p_os << 2) + (t_os << 5)
+        self._write(_BMP280_REGISTER_CONFIG, iir << 2)
+
+    def _trigger(self):
+        # a single register write, no read-modify-write of the bit fields
+        self._ctrl_buf[0] = self._ctrl_forced
+        self._bmp_i2c.writeto_mem(self._i2c_addr, _BMP280_REGISTER_CONTROL, self._ctrl_buf)
+
+    def measure(self, result):
+        """
+        Triggers a forced measurement, waits for it and reads temperature and
+        pressure with one burst read.
+
+        Neither the I2C transfers nor the compensation allocate, for sensor
+        readings in the operating range all arithmetic stays in small ints.
+
+        result: array of length 2 or alike, receives the temperature in
+        0.01 degC and the pressure in Pa. Returned.
+        """
+        self._trigger()
+        time.sleep_ms(self.read_wait_ms)
+        self._bmp_i2c.readfrom_mem_into(self._i2c_addr, _BMP280_REGISTER_DATA, self._data_buf)
+        return self._compensate(result)
+
+    async def measure_async(self, result):
+        """
+        Like measure(), but awaits the conversion time instead of blocking.
+        """
+        self._trigger()
+        await asyncio.sleep_ms(self.read_wait_ms)
+        self._bmp_i2c.readfrom_mem_into(self._i2c_addr, _BMP280_REGISTER_DATA, self._data_buf)
+        return self._compensate(result)
+
+    def _compensate(self, result):
+        # 32-bit formulas from the datasheet, on one snapshot of the data
+        d = self._data_buf
+        self._p_raw = p_raw = (d[0] << 12) + (d[1] << 4) + (d[2] >> 4)
+        self._t_raw = t_raw = (d[3] << 12) + (d[4] << 4) + (d[5] >> 4)
+
+        var1 = (((t_raw >> 3) - (self._T1 << 1)) * self._T2) >> 11
+        var2 = (t_raw >> 4) - self._T1
+        var2 = (((var2 * var2) >> 12) * self._T3) >> 14
+        self._t_fine = t_fine = var1 + var2
+        result[0] = (t_fine * 5 + 128) >> 8
+
+        var1 = (t_fine >> 1) - 64000
+        var2 = (((var1 >> 2) * (var1 >> 2)) >> 11) * self._P6
+        var2 = var2 + ((var1 * self._P5) << 1)
+        var2 = (var2 >> 2) + (self._P4 << 16)
+        var1 = (((self._P3 * (((var1 >> 2) * (var1 >> 2)) >> 13)) >> 3)
+                + ((self._P2 * var1) >> 1)) >> 18
+        var1 = ((32768 + var1) * self._P1) >> 15
+        if var1 == 0:
+            result[1] = 0
+            return result
+
+        # p * 3125 would leave the small int range, so the division is split
+        # into quotient and remainder, rounding like the unsigned datasheet code
+        p = 1048576 - p_raw - (var2 >> 12)
+        q = p // var1
+        if p < 687195:
+            p = q * 6250 + (p - q * var1) * 6250 // var1
+        else:
+            p = (q * 3125 + (p - q * var1) * 3125 // var1) << 1
+        var1 = (self._P9 * (((p >> 3) * (p >> 3)) >> 13)) >> 12
+        var2 = ((p >> 2) * self._P8) >> 13
+        result[1] = p + ((var1 + var2 + self._P7) >> 4)
+        return result
+
     def _write_bits(self, address, value, length, shift=0):
         d = self._read(address)[0]
         m = int('1' * length, 2) << shift
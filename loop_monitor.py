@@ -0,0 +1,150 @@
+"""
+Finds what blocks the event loop.
+
+LoopMonitor.run() wakes up every `interval_ms` and measures how late it was
+woken, which is how long some task kept the loop from running the others.
+Tasks started through timed() have every step between two awaits timed, so
+the one that blocked can be named. Optionally the hardware watchdog resets
+the board when the loop stays stuck.
+"""
+import asyncio
+import time
+import config
+import machine
+from metrics import Histogram, register
+
+class TaskStats:
+    """
+    Timing of the steps of one kind of task, i.e. the time between two awaits.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.steps = 0
+        self.max_us = 0
+        self.slow = 0
+        self.logged = 0
+
+class _Timed:
+    """
+    Coroutine wrapper timing every step of the wrapped coroutine.
+
+    The scheduler drives it with send() and throw() like any coroutine, each
+    call runs the wrapped coroutine until its next await.
+    """
+    def __init__(self, monitor, stats, coro):
+        self._monitor = monitor
+        self._stats = stats
+        self._coro = coro
+
+    def send(self, value):
+        started = time.ticks_us()
+        try:
+            return self._coro.send(value)
+        finally:
+            self._monitor._step(self._stats, time.ticks_diff(time.ticks_us(), started))
+
+    def throw(self, *args):
+        started = time.ticks_us()
+        try:
+            return self._coro.throw(*args)
+        finally:
+            self._monitor._step(self._stats, time.ticks_diff(time.ticks_us(), started))
+
+    def close(self):
+        self._coro.close()
+
+    def __await__(self):
+        return self
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.send(None)
+
+class LoopMonitor:
+    """
+    Measures event loop lag and the longest blocking step of each timed task.
+
+    Args:
+        warn_ms: Lag or step duration that gets logged.
+        wdt_timeout_ms: Reset the board through the hardware watchdog when the
+            loop is stuck this long, 0 to not use the watchdog.
+        interval_ms: Time between the monitor's wake ups.
+    """
+    # Time between two log lines about the same task
+    LOG_INTERVAL_MS = 10000
+
+    def __init__(self, warn_ms, wdt_timeout_ms=0, interval_ms=100):
+        self.warn_ms = warn_ms
+        self.wdt_timeout_ms = wdt_timeout_ms
+        self.interval_ms = interval_ms
+        self.lag_ms = Histogram((5, 10, 20, 50, 100, 200, 500, 1000))
+        self.tasks = {}
+        self._warn_us = warn_ms * 1000
+        # Longest step since the monitor last woke up, the likely cause of its lag
+        self._tick_max_us = 0
+        self._tick_max = None
+        self._lags = 0
+        self._logged = 0
+
+    def timed(self, name, coro):
+        """
+        Returns `coro` wrapped to have its steps timed under `name`, for
+        create_task(). Tasks with the same name share their statistics.
+        """
+        stats = self.tasks.get(name)
+        if stats is None:
+            stats = self.tasks[name] = TaskStats(name)
+        return _Timed(self, stats, coro)
+
+    def _step(self, stats, us):
+        stats.steps += 1
+        if us > stats.max_us:
+            stats.max_us = us
+        if us > self._tick_max_us:
+            self._tick_max_us = us
+            self._tick_max = stats
+        if us > self._warn_us:
+            stats.slow += 1
+            now = time.ticks_ms()
+            if time.ticks_diff(now, stats.logged) > self.LOG_INTERVAL_MS:
+                stats.logged = now
+                print(f"Task {stats.name} blocked the event loop for {us // 1000} ms "
+                      f"({stats.slow} times over {self.warn_ms} ms)")
+
+    def max_block_ms(self):
+        """
+        Returns (task name, longest step in ms) of every timed task.
+        """
+        return [(name, stats.max_us // 1000) for name, stats in self.tasks.items()]
+
+    async def run(self):
+        """
+        Measures the lag and feeds the watchdog, never returns.
+        """
+        wdt = machine.WDT(timeout=self.wdt_timeout_ms) if self.wdt_timeout_ms else None
+        expected = time.ticks_add(time.ticks_ms(), self.interval_ms)
+        while True:
+            await asyncio.sleep_ms(self.interval_ms)
+            now = time.ticks_ms()
+            lag = max(0, time.ticks_diff(now, expected))
+            expected = time.ticks_add(now, self.interval_ms)
+            self.lag_ms.observe(lag)
+            if wdt:
+                wdt.feed()
+            if lag > self.warn_ms:
+                self._lags += 1
+                if time.ticks_diff(now, self._logged) > self.LOG_INTERVAL_MS:
+                    self._logged = now
+                    culprit = self._tick_max.name if self._tick_max else 'an untimed task'
+                    print(f"Event loop lagged {lag} ms, longest step {self._tick_max_us // 1000} ms in "
+                          f"{culprit} ({self._lags} lags over {self.warn_ms} ms)")
+            self._tick_max_us = 0
+            self._tick_max = None
+
+monitor = LoopMonitor(config.loop_warn_ms, config.wdt_timeout_s * 1000)
+
+register('doorbell_loop_lag_ms', "Time the event loop was late to wake up the monitor", monitor.lag_ms)
+register('doorbell_task_max_block_ms', "Longest time a task ran between two awaits", monitor.max_block_ms,
+         label='task')
@@ -1,17 +1,21 @@
 import machine
 import time
 import network
-import umqtt.robust as mqtt
 import json
 import ubinascii
 import asyncio
-import micropython
 
 import config
 from connect import connect_wifi
 
 import bme280_if
-import gc
+from events import EventRing
+from mqtt_async import MQTTClient
+import metrics
+from metrics import Histogram
+from memory import gc_manager
+from loop_monitor import monitor
+from sensor_reporter import SensorReporter
 
 
 # ----- Config -----
@@ -20,6 +24,10 @@ DEVICE_ID = ubinascii.hexlify(machine.unique_id()).decode()
 
 # Topics for MQTT auto-discovery
 MQTT_DISCOVERY_TOPIC = f'homeassistant/device/{DEVICE_ID}/config'
+# Home Assistant announces itself here with "online" after every (re)start
+HA_STATUS_TOPIC = 'homeassistant/status'
+# All environment sensor readings are published together as one JSON object
+ENV_STATE_TOPIC = 'doorbell/env_sens/state'
 
 # ----- Global variables -----
 # Variable to track the last time the button was pressed
@@ -27,22 +35,35 @@ last_press_time = 0
 # TODO: move to config
 mqtt_client = None
 
-event_queue = []
+# Button presses (ticks_us of the press), filled by the IRQ handler
+button_events = EventRing()
+# Time from button press to the MQTT publish, in ms
+press_latency = Histogram((1, 2, 5, 10, 20, 50, 100, 200, 500))
+# Time a sensor reading takes, including the conversion, in ms
+sensor_read_ms = Histogram((5, 10, 20, 50, 100, 200))
+metrics.register('doorbell_press_latency_ms', "Time from button press until the broker acknowledged it", press_latency)
+metrics.register('doorbell_sensor_read_ms', "Time a sensor reading takes", sensor_read_ms)
+metrics.register('doorbell_button_overflows_total', "Button presses lost to a full event ring",
+                 lambda: button_events.overflows, 'counter')
+
+# Averages the environment readings and decides when to publish them
+sens_reporter = SensorReporter(config.sens_deadband, config.sens_heartbeat_t * 1000, config.sens_avg)
+
+# Serialized discovery payload, built once by _mqtt_discovery()
+discovery_bytes = None
 
 # TODO: add IP address to discovery payload ?
 # TODO: move to own module
-def _mqtt_discovery():
-    
+def _build_discovery_payload():
     """
-    Publishes a combined discovery payload for all components of the doorbell device to the MQTT broker.
-
-    This function is called once at startup and is responsible for publishing the configuration of the device to the MQTT broker.
+    Builds the combined discovery payload for all components of the doorbell device.
 
     The payload is JSON encoded and contains the following information:
     - Device metadata (optional)
     - Components of the device (e.g. button, environment sensors)
 
-    The payload is published to the topic defined by the MQTT_DISCOVERY_TOPIC constant.
+    Returns:
+        bytes: The serialized payload.
     """
 
     discovery_payload = {
@@ -67,47 +88,63 @@ def _mqtt_discovery():
             },
             "temp": {  # Environment sensor
                 "p": "sensor",
-                "state_topic": "doorbell/env_sens/temp",
+                "state_topic": ENV_STATE_TOPIC,
                 "unique_id": "doorbell_temp",
                 "name": "Doorbell temperature",
                 "unit_of_measurement": "°C",
-                "value_template": '{{ value }}'
+                "value_template": '{{ value_json.temp }}'
             },
             "humd": {  # Environment sensor
                 "p": "sensor",
-                "state_topic": "doorbell/env_sens/humd",
+                "state_topic": ENV_STATE_TOPIC,
                 "unique_id": "doorbell_hum",
                 "name": "Doorbell humidity",
                 "unit_of_measurement": "%",
-                "value_template": '{{ value }}'
+                "value_template": '{{ value_json.humd }}'
             },
             "press": {  # Environment sensor
                 "p": "sensor",
-                "state_topic": "doorbell/env_sens/press",
+                "state_topic": ENV_STATE_TOPIC,
                 "unique_id": "doorbell_press",
                 "name": "Doorbell pressure",
                 "unit_of_measurement": "hPa",
-                "value_template": '{{ value }}'
+                "value_template": '{{ value_json.press }}'
             }
         }
     }
 
-    # Publish the combined discovery payload
-    print("Payload size: ", len(json.dumps(discovery_payload)))
-    print("Sending combined discovery payload:\n", bytes(json.dumps(discovery_payload),'utf-8'))
-    
-    mqtt_client.publish(MQTT_DISCOVERY_TOPIC, bytes(json.dumps(discovery_payload),'utf-8'))
+    if bme280_if.sensor is None:
+        for name in ("temp", "humd", "press"):
+            del discovery_payload["cmps"][name]
+    elif not bme280_if.has_humidity():
+        del discovery_payload["cmps"]["humd"]
+
+    return json.dumps(discovery_payload).encode()
+
+def _mqtt_discovery():
+    """
+    Publishes the combined discovery payload to the MQTT_DISCOVERY_TOPIC topic.
+
+    The payload is serialized on the first call only and published retained,
+    so Home Assistant finds the device even if it starts after the doorbell.
+    It is published again whenever Home Assistant comes back online, see
+    _mqtt_message().
+    """
+    global discovery_bytes
+    if discovery_bytes is None:
+        discovery_bytes = _build_discovery_payload()
+        print("Discovery payload size: ", len(discovery_bytes))
+
+    mqtt_client.publish(MQTT_DISCOVERY_TOPIC, discovery_bytes, retain=True)
 
 # Function to run when the button is pressed
 def _button_pressed_ISR(pin):
     global last_press_time
     current_time = time.ticks_ms()  # Get the current time in milliseconds
     if time.ticks_diff(current_time, last_press_time) > config.dbnc_delay:
-        micropython.schedule(_button_pressed_callback, 0)
+        # Doesn't allocate, so it is safe even in a hard IRQ, and wakes _button_task
+        button_events.put(time.ticks_us())
     last_press_time = current_time
-
-def _button_pressed_callback(_): 
-    event_queue.append('button_pressed')       
         
 # Connect to Wi-Fi
 def _connect_wifi():
@@ -130,64 +167,86 @@ def _connect_wifi():
     print("Connected to Wi-Fi")
     return wlan
 
-async def _memory_cleanup() -> None:
+def _mqtt_setup():
     """
-    Runs a periodic garbage collection to free up memory.
-
-    This is necessary because the camera module allocates memory for the frames
-    and does not release it back to the system. This can lead to a memory leak
-    over time. The garbage collector is run every 5 minutes to clean up unused
-    memory.
+    Creates the MQTT client. It connects, and reconnects, on its own once
+    its run() task is started, publishing never blocks the event loop.
     """
-    while True:
-        print("Memory cleanup.")
-        gc.collect()
-        await asyncio.sleep(100)
-
-def _mqtt_setup():
     global mqtt_client
-    mqtt_client = mqtt.MQTTClient(config.MQTT_CLIENT_ID, config.MQTT_BROKER, port=config.MQTT_PORT)
-    mqtt_client.connect()
-    print("MQTT client connected")
+    mqtt_client = MQTTClient(config.MQTT_CLIENT_ID, config.MQTT_BROKER, port=config.MQTT_PORT)
+    mqtt_client.on_delivered = _press_delivered
+    mqtt_client.set_callback(_mqtt_message)
+    mqtt_client.subscribe(HA_STATUS_TOPIC)
+
+    metrics.register('doorbell_mqtt_publish_ms', "Time from publish until sent or acknowledged", mqtt_client.latency)
+    metrics.register('doorbell_mqtt_queue_depth', "Messages waiting to be sent", mqtt_client.queue_depth)
+    metrics.register('doorbell_mqtt_dropped_total', "Messages dropped from the full queue",
+                     lambda: mqtt_client.dropped, 'counter')
+    metrics.register('doorbell_mqtt_connected', "Whether the MQTT client is connected",
+                     lambda: int(mqtt_client.connected))
+
+def _mqtt_message(topic, msg):
+    if topic == HA_STATUS_TOPIC.encode() and msg == b'online':
+        print("Home Assistant online, republishing discovery.")
+        _mqtt_discovery()
+
+def _press_delivered(pressed):
+    latency = time.ticks_diff(time.ticks_us(), pressed) // 1000
+    press_latency.observe(latency)
+    print(f"Press delivered after {latency} ms ({press_latency.summary()})")
 
 # ----- Tasks -----
 async def _button_task():
     """
-    Monitors the button state and publishes a message to the MQTT broker when the button is pressed.
+    Publishes a message to the MQTT broker when the button is pressed.
 
-    This function runs in an infinite loop, checking the event queue for button press events.
-    When a button press event is detected, it publishes a message to the MQTT topic defined
-    by the BUTTON_TOPIC constant. The message payload is "short_press".
+    This function runs in an infinite loop, waiting on the button event ring.
+    The IRQ handler wakes it directly, so a press is published as soon as the
+    event loop gets to it instead of on the next poll. The message payload is
+    "short_press", sent with QoS 1 so a press isn't lost to a reconnect.
 
-    The function sleeps for 100 milliseconds between checks to avoid busy-waiting.
+    The time from the press until the broker acknowledged it is recorded in
+    press_latency.
     """
-    global event_queue
     while True:
-        if event_queue:
-            event = event_queue.pop(0)
-            if event == 'button_pressed':
-                print("Button pressed!")
-                mqtt_client.publish("doorbell/triggers/button1", "short_press")
-        await asyncio.sleep(0.1)
-
-async def sens_task():
-    # initialize BME380
+        await button_events.wait()
+        while button_events.pending():
+            pressed = button_events.get()
+            print("Button pressed!")
+            mqtt_client.publish("doorbell/triggers/button1", "short_press", qos=1, ts=pressed)
+
+def _sensor_setup():
+    # Before the discovery, which only announces the sensors that were found
     try:
         bme280_if.sensor_init()
-    except:
-        raise Exception("BME280 not found. Check wiring.")
+        print("Sensor initialized")
+    except Exception as e:
+        print(f"BME280 not found, check wiring ({e})")
 
-    print("Sensor initialized")
+async def sens_task():
+    if bme280_if.sensor is None:
+        return
 
     await asyncio.sleep(2)  # wait for sensor to stabilize
 
     while True:
-        temp, press, humd = bme280_if.read_sensor()
-        print(f"Temp: {temp} °C, Humidity: {humd} %, Pressure: {press} hPa")
-
-        mqtt_client.publish("doorbell/env_sens/temp", temp)
-        mqtt_client.publish("doorbell/env_sens/humd", humd)
-        mqtt_client.publish("doorbell/env_sens/press", press)
+        started = time.ticks_us()
+        readings = await bme280_if.read_sensor()
+        sensor_read_ms.observe(time.ticks_diff(time.ticks_us(), started) // 1000)
+        if sens_reporter.add(readings):
+            temp, press, humd = sens_reporter.values
+            temp = bme280_if.hundredths(temp)
+            press = bme280_if.hundredths(press)
+            if bme280_if.has_humidity():
+                humd = bme280_if.hundredths(humd)
+                payload = f'{{"temp":{temp},"humd":{humd},"press":{press}}}'
+            else:
+                payload = f'{{"temp":{temp},"press":{press}}}'
+            print(f"Environment: {payload} "
+                  f"({sens_reporter.suppressed} of {sens_reporter.samples} samples suppressed)")
+
+            mqtt_client.publish(ENV_STATE_TOPIC, payload)
+        gc_manager.gap()
         # TODO: move to config 
         await asyncio.sleep(config.sens_t)
 
@@ -197,6 +256,7 @@ def main():
     wlan = connect_wifi()
     DEVICE_IP = wlan.ifconfig()[0]  # Get the assigned IP address
     _mqtt_setup()
+    _sensor_setup()
     
     # Publish discovery message
     _mqtt_discovery()
@@ -207,13 +267,15 @@ def main():
     button.irq(trigger=machine.Pin.IRQ_FALLING | machine.Pin.IRQ_RISING, handler=_button_pressed_ISR)
 
     loop = asyncio.get_event_loop()
-    loop.create_task(_button_task())
-    loop.create_task(sens_task())
-    loop.create_task(_memory_cleanup())
+    loop.create_task(monitor.timed('mqtt', mqtt_client.run()))
+    loop.create_task(monitor.timed('button', _button_task()))
+    loop.create_task(monitor.timed('sensor', sens_task()))
+    loop.create_task(monitor.timed('cleanup', gc_manager.run()))
+    loop.create_task(monitor.run())
     
     try:
         from stream_server import stream_server_start 
-        loop.create_task(stream_server_start(DEVICE_IP))
+        loop.create_task(stream_server_start(DEVICE_IP, config.http_port))
     except KeyboardInterrupt:
         print("Server stopped")
     
@@ -0,0 +1,172 @@
+"""
+Garbage collection scheduled around the work instead of at random times.
+
+The stream and the sensor task call gap() when they are between frames or
+cycles. A collection runs there once enough has been allocated since the
+last one, so it doesn't land in the middle of sending a frame. The heap is
+only queried once a second, gap() compares the time with when the
+collection is due at the measured rate, as it is called for every frame and
+gc.mem_alloc() and gc.mem_free() each walk the whole heap. The automatic
+collection threshold is set from the measured allocation rate to twice that
+amount, it only triggers when no gap came along in time.
+"""
+import asyncio
+import gc
+import time
+import config
+from metrics import Counter, Histogram, register
+
+try:
+    import esp32
+except ImportError:
+    esp32 = None
+
+def fragmentation():
+    """
+    Returns how fragmented the IDF data heap is in percent, 100 minus the
+    largest free block as a share of all free memory, or None off the ESP32.
+    """
+    if esp32 is None:
+        return None
+    free = 0
+    largest = 0
+    for info in esp32.idf_heap_info(esp32.HEAP_DATA):
+        free += info[1]
+        largest = max(largest, info[2])
+    return 100 - largest * 100 // free if free else 100
+
+class MemoryManager:
+    """
+    Collects garbage in the gaps between frames and sensor cycles.
+
+    Args:
+        period_ms: Collect at a gap once about this much time worth of
+            allocations has piled up.
+        min_free: Collect at the next gap regardless when less than this many
+            bytes are free.
+        min_threshold: Lowest automatic collection threshold in bytes.
+        report_ms: Time between the memory reports printed by run().
+    """
+    # Each per-second sample moves the averaged rate by 1/2**RATE_SHIFT
+    RATE_SHIFT = 2
+    # Latest a collection is scheduled ahead, the schedule is renewed every second anyway
+    MAX_DUE_MS = 60000
+
+    def __init__(self, period_ms, min_free, min_threshold=65536, report_ms=300000):
+        self.period_ms = period_ms
+        self.min_free = min_free
+        self.min_threshold = min_threshold
+        self.report_ms = report_ms
+        # Allocation rate in bytes/s, averaged
+        self.rate = 0
+        self.threshold = min_threshold
+        self.pause_ms = Histogram((1, 2, 5, 10, 20, 50, 100, 200))
+        self.collections = Counter()
+        # Collections that ran on their own, because no gap came in time
+        self.automatic = Counter()
+        self._since_collect = 0
+        self._allocated = 0
+        self._last_alloc = gc.mem_alloc()
+        self._last_sample = time.ticks_ms()
+        self._last_gap = 0
+        # ticks_ms when the next gap collection is due
+        self._due = time.ticks_add(self._last_sample, self.MAX_DUE_MS)
+
+    def gap(self):
+        """
+        Tells the manager the caller is between units of work, it may collect now.
+
+        Returns:
+            True if it collected.
+        """
+        self._last_gap = time.ticks_ms()
+        if time.ticks_diff(self._last_gap, self._due) >= 0:
+            self.collect()
+            return True
+        return False
+
+    def _schedule(self, now, pending, low):
+        # Due when half the threshold has been allocated at the current rate
+        left = self.threshold // 2 - pending
+        if low or left <= 0:
+            self._due = now
+        elif self.rate:
+            self._due = time.ticks_add(now, min(self.MAX_DUE_MS, left * 1000 // self.rate))
+        else:
+            self._due = time.ticks_add(now, self.MAX_DUE_MS)
+
+    def collect(self):
+        before = gc.mem_alloc()
+        started = time.ticks_us()
+        gc.collect()
+        self.pause_ms.observe(time.ticks_diff(time.ticks_us(), started) // 1000)
+        self.collections.inc()
+        # Keep what was allocated since the last sample for the rate
+        self._allocated += max(0, before - self._last_alloc)
+        self._last_alloc = gc.mem_alloc()
+        self._since_collect = 0
+        self._schedule(time.ticks_ms(), 0, False)
+
+    def _sample(self):
+        now = time.ticks_ms()
+        alloc = gc.mem_alloc()
+        if alloc >= self._last_alloc:
+            self._allocated += alloc - self._last_alloc
+            self._since_collect += alloc - self._last_alloc
+        else:
+            # An automatic collection ran, what was allocated before it is lost
+            self.automatic.inc()
+            self._since_collect = 0
+        self._last_alloc = alloc
+
+        elapsed = time.ticks_diff(now, self._last_sample)
+        if elapsed > 0:
+            rate = self._allocated * 1000 // elapsed
+            self.rate += (rate - self.rate) >> self.RATE_SHIFT
+        self._allocated = 0
+        self._last_sample = now
+
+        # Twice the gap collection amount, but never more than half of what is free
+        free = gc.mem_free()
+        threshold = self.rate * self.period_ms // 500
+        self.threshold = max(self.min_threshold, min(threshold, free // 2))
+        gc.threshold(self.threshold)
+
+        # Low on memory, but only once something was allocated since the last
+        # collection, collecting again wouldn't free anything
+        low = free < self.min_free and self._since_collect >= self.min_threshold // 4
+        self._schedule(now, self._since_collect, low)
+
+    def report(self):
+        frag = fragmentation()
+        print(f"Memory: {gc.mem_free()} free, {'?' if frag is None else frag}% fragmented, "
+              f"{self.rate} B/s allocated, threshold {self.threshold}, "
+              f"{self.collections.value} collections ({self.automatic.value} automatic), "
+              f"pause {self.pause_ms.summary()}")
+
+    async def run(self):
+        """
+        Updates the allocation rate and threshold every second, never returns.
+
+        While nothing calls gap(), e.g. when nobody watches the stream, the
+        collections run from here instead.
+        """
+        reported = time.ticks_ms()
+        while True:
+            await asyncio.sleep(1)
+            self._sample()
+            now = time.ticks_ms()
+            if time.ticks_diff(now, self._last_gap) > self.period_ms * 2:
+                self.gap()
+            if time.ticks_diff(now, reported) >= self.report_ms:
+                reported = now
+                self.report()
+
+gc_manager = MemoryManager(config.gc_period_ms, config.gc_min_free)
+
+register('doorbell_gc_pause_ms', "Time a garbage collection took", gc_manager.pause_ms)
+register('doorbell_gc_collections_total', "Garbage collections run at a gap", gc_manager.collections)
+register('doorbell_gc_automatic_total', "Garbage collections the threshold triggered", gc_manager.automatic)
+register('doorbell_gc_threshold_bytes', "Automatic garbage collection threshold", lambda: gc_manager.threshold)
+register('doorbell_alloc_rate_bytes', "Allocation rate in bytes per second", lambda: gc_manager.rate)
+register('doorbell_heap_fragmentation_percent', "Fragmentation of the IDF data heap", fragmentation)
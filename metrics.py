@@ -0,0 +1,147 @@
+"""
+Runtime metrics, rendered in the Prometheus text format for /metrics.
+
+Histograms and counters are updated on the hot paths, so they only change
+preallocated small ints and arrays, nothing is allocated per update. The
+text is only built when /metrics is scraped.
+"""
+import gc
+from array import array
+
+try:
+    import esp32
+except ImportError:
+    esp32 = None
+
+# Histogram sums are carried over into sum_high before they leave the small
+# int range, which would allocate on every update
+_SUM_LIMIT = 1 << 29
+
+class Histogram:
+    """
+    Counts observations in fixed buckets without allocating per observation.
+
+    Args:
+        bounds: Inclusive upper bounds of the buckets in ascending order. Values
+            above the last bound are only counted in the total.
+    """
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = array('I', [0] * len(bounds))
+        self.count = 0
+        self.sum = 0
+        self.sum_high = 0
+        self.max = 0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        if self.sum >= _SUM_LIMIT:
+            self.sum -= _SUM_LIMIT
+            self.sum_high += 1
+        if value > self.max:
+            self.max = value
+        for i in range(len(self.bounds)):
+            if value <= self.bounds[i]:
+                self.counts[i] += 1
+                return
+
+    def total(self):
+        """
+        Returns the sum of all observations.
+        """
+        return self.sum_high * _SUM_LIMIT + self.sum
+
+    def summary(self):
+        """
+        Returns a one-line, human readable summary of the buckets.
+        """
+        parts = [f"<={bound}: {count}" for bound, count in zip(self.bounds, self.counts)]
+        parts.append(f">{self.bounds[-1]}: {self.count - sum(self.counts)}")
+        return f"n={self.count} max={self.max} " + ", ".join(parts)
+
+class Counter:
+    """
+    A count that only goes up.
+    """
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+# Metrics in the order they are rendered, (name, help, type, source, label) tuples
+_registry = []
+
+def register(name, help, source, kind='gauge', label=None):
+    """
+    Adds a metric to /metrics.
+
+    Args:
+        name: Metric name, counters end in _total.
+        help: One line description.
+        source: A Histogram, a Counter or a function returning the current
+            value, or None when it isn't available.
+        kind: 'gauge' or 'counter' for functions, ignored for Histogram and Counter.
+        label: Label name when the function returns a list of (label value,
+            value) pairs, one series per pair.
+    """
+    if isinstance(source, Histogram):
+        kind = 'histogram'
+    elif isinstance(source, Counter):
+        kind = 'counter'
+    _registry.append((name, help, kind, source, label))
+
+def _render_histogram(lines, name, histogram):
+    # The buckets count each observation once, Prometheus wants them cumulative
+    cumulative = 0
+    for bound, count in zip(histogram.bounds, histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{le="+Inf"}} {histogram.count}')
+    lines.append(f'{name}_sum {histogram.total()}')
+    lines.append(f'{name}_count {histogram.count}')
+
+def render():
+    """
+    Returns all registered metrics in the Prometheus text format, as bytes.
+    """
+    lines = []
+    for name, help, kind, source, label in _registry:
+        if kind == 'histogram':
+            value = source
+        elif kind == 'counter' and isinstance(source, Counter):
+            value = source.value
+        else:
+            try:
+                value = source()
+            except Exception:
+                value = None
+        if value is None:
+            continue
+
+        lines.append(f'# HELP {name} {help}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'histogram':
+            _render_histogram(lines, name, value)
+        elif label:
+            for label_value, series in value:
+                lines.append(f'{name}{{{label}="{label_value}"}} {series}')
+        else:
+            lines.append(f'{name} {value}')
+    lines.append('')
+    return '\n'.join(lines).encode()
+
+def largest_free_block():
+    """
+    Returns the largest free block of the IDF data heap, where the camera
+    frame buffers and new MicroPython heap areas are allocated, or None off
+    the ESP32.
+    """
+    if esp32 is None:
+        return None
+    return max(info[2] for info in esp32.idf_heap_info(esp32.HEAP_DATA))
+
+register('doorbell_heap_free_bytes', "Free MicroPython heap", gc.mem_free)
+register('doorbell_heap_alloc_bytes', "Allocated MicroPython heap", gc.mem_alloc)
+register('doorbell_heap_largest_free_bytes', "Largest free block of the IDF data heap", largest_free_block)
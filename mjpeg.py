@@ -0,0 +1,100 @@
+"""
+Multipart (MJPEG) framing for the camera stream.
+
+Part headers are prebuilt once and only the Content-Length digits are filled
+in per frame, in place. The header is sent together with the head of the
+frame in one write, so the first TCP segment of every part is a full one,
+and the rest of the frame is written straight from a memoryview in chunks.
+Nothing frame-sized is allocated or copied per frame here. stream_server
+copies each frame once out of the driver's buffer, into a reused one.
+"""
+
+BOUNDARY = b'frame'
+STREAM_CONTENT_TYPE = b'multipart/x-mixed-replace; boundary=' + BOUNDARY
+
+# Size of the writes the frame is split into, about two TCP segments on lwIP
+CHUNK_SIZE = 2872
+
+# Every part starts with CRLF, which also terminates the previous part's data
+_PREFIX_JPEG = b'\r\n--' + BOUNDARY + b'\r\nContent-Type: image/jpeg\r\nContent-Length: '
+_PREFIX_BMP = b'\r\n--' + BOUNDARY + b'\r\nContent-Type: image/bmp\r\nContent-Length: '
+
+def _put_int(buf, pos, value):
+    """
+    Writes the decimal digits of a non-negative int into buf at pos without
+    allocating and returns the position after the last digit.
+    """
+    digits = 1
+    limit = 10
+    while value >= limit:
+        digits += 1
+        limit *= 10
+    end = pos + digits
+    i = end
+    while i > pos:
+        i -= 1
+        buf[i] = 48 + value % 10
+        value //= 10
+    return end
+
+async def write_chunks(writer, data, start=0, chunk_size=CHUNK_SIZE):
+    """
+    Writes data from offset start in chunk_size pieces, draining after each.
+
+    Draining per chunk keeps the writer's own buffer empty, so a short write
+    never makes it copy the rest of the frame, and gives other tasks (other
+    viewers) a chance to run in between.
+    """
+    mv = data if isinstance(data, memoryview) else memoryview(data)
+    end = len(mv)
+    while start < end:
+        stop = min(start + chunk_size, end)
+        writer.write(mv[start:stop])
+        await writer.drain()
+        start = stop
+
+class PartWriter:
+    """
+    Writes frames as parts of a multipart/x-mixed-replace stream.
+
+    Each viewer owns one PartWriter, its buffer is reused for every frame.
+
+    Args:
+        chunk_size: Size of the writes a frame is split into. The first one
+            carries the part header and the beginning of the frame.
+    """
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self._buf = bytearray(chunk_size)
+        self._mv = memoryview(self._buf)
+
+    async def write_part(self, writer, frame, jpeg=True):
+        """
+        Writes one frame with its part header and Content-Length.
+
+        Relies on drain() returning only once the written data has been sent
+        or copied, as MicroPython's StreamWriter does, since the header buffer
+        is reused for the next part.
+
+        Args:
+            writer: The client's stream writer.
+            frame: The frame, preferably as a memoryview shared by all viewers.
+            jpeg: Whether the frame is a JPEG, a BMP otherwise.
+        """
+        prefix = _PREFIX_JPEG if jpeg else _PREFIX_BMP
+        buf = self._buf
+        mv = self._mv
+        frame_len = len(frame)
+
+        pos = len(prefix)
+        mv[:pos] = prefix
+        pos = _put_int(buf, pos, frame_len)
+        mv[pos:pos + 4] = b'\r\n\r\n'
+        pos += 4
+
+        head = min(self.chunk_size - pos, frame_len)
+        mv[pos:pos + head] = frame[:head]
+        writer.write(mv[:pos + head])
+        await writer.drain()
+
+        await write_chunks(writer, frame, head, self.chunk_size)
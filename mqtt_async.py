@@ -0,0 +1,283 @@
+import asyncio
+import time
+from metrics import Histogram
+
+# MQTT 3.1.1 packet types
+_CONNECT = 0x10
+_CONNACK = 0x20
+_PUBLISH = 0x30
+_PUBACK = 0x40
+_SUBSCRIBE = 0x82
+_SUBACK = 0x90
+_PINGREQ = 0xC0
+_PINGRESP = 0xD0
+
+def _encode_len(n):
+    out = bytearray()
+    while True:
+        byte = n & 0x7F
+        n >>= 7
+        out.append(byte | 0x80 if n else byte)
+        if not n:
+            return out
+
+def _encode_str(s):
+    if isinstance(s, str):
+        s = s.encode()
+    return len(s).to_bytes(2, 'big') + s
+
+class MQTTClient:
+    """
+    Asyncio MQTT client that never blocks the event loop.
+
+    publish() only puts the message in a bounded outbound queue and returns.
+    run() keeps the connection up in the background: it connects (and
+    reconnects with backoff), sends the queued messages, pings the broker to
+    honour the keepalive and dispatches incoming messages to the callback.
+    When the queue is full the oldest message is dropped and counted.
+
+    QoS 1 messages are kept until the broker acknowledges them and are sent
+    again after a reconnect. Subscriptions are renewed on every connect.
+
+    Args:
+        client_id: MQTT client identifier.
+        server: Broker host.
+        port: Broker port.
+        user: Optional user name.
+        password: Optional password.
+        keepalive: Keepalive interval in seconds.
+        queue_size: Number of messages the outbound queue holds.
+    """
+    def __init__(self, client_id, server, port=1883, user=None, password=None, keepalive=60, queue_size=16):
+        self.client_id = client_id
+        self.server = server
+        self.port = port
+        self.user = user
+        self.password = password
+        self.keepalive = keepalive
+        self.connected = False
+        # Called with the `ts` given to publish() once the message has been sent
+        # (QoS 0) or acknowledged (QoS 1)
+        self.on_delivered = None
+
+        self.published = 0
+        self.dropped = 0
+        self.reconnects = 0
+        # Time from publish() until the message was sent (QoS 0) or acknowledged (QoS 1), in ms
+        self.latency = Histogram((5, 10, 20, 50, 100, 200, 500, 1000, 5000))
+
+        self._queue = [None] * queue_size
+        self._head = 0
+        self._tail = 0
+        self._count = 0
+        self._inflight = {}
+        self._pid = 0
+        self._subs = []
+        self._subs_pending = False
+        self._acks = []
+        self._cb = None
+        self._wake = asyncio.Event()
+        self._reader = None
+        self._writer = None
+        self._last_rx = 0
+        self._last_tx = 0
+
+    def set_callback(self, cb):
+        """
+        Sets the function called with (topic, msg) for every incoming message.
+        """
+        self._cb = cb
+
+    def subscribe(self, topic, qos=0):
+        self._subs.append((topic, qos))
+        self._subs_pending = True
+        self._wake.set()
+
+    def publish(self, topic, msg, retain=False, qos=0, ts=None):
+        """
+        Queues a message for sending and returns immediately.
+
+        Args:
+            topic: Topic to publish to.
+            msg: Payload, str or bytes.
+            retain: Whether the broker should retain the message.
+            qos: 0 or 1.
+            ts: Optional value passed to on_delivered once the message is delivered.
+        """
+        if self._count == len(self._queue):
+            self._tail = (self._tail + 1) % len(self._queue)
+            self._count -= 1
+            self.dropped += 1
+        self._queue[self._head] = (topic, msg, retain, qos, ts, time.ticks_ms())
+        self._head = (self._head + 1) % len(self._queue)
+        self._count += 1
+        self._wake.set()
+
+    def queue_depth(self):
+        return self._count
+
+    async def run(self):
+        """
+        Keeps the connection up and the queue flowing, never returns.
+        """
+        delay = 1
+        while True:
+            try:
+                await asyncio.wait_for(self._connect(), 10)
+                delay = 1
+                reader_task = asyncio.create_task(self._read_loop())
+                try:
+                    await self._write_loop()
+                finally:
+                    reader_task.cancel()
+            except Exception as e:
+                print(f"MQTT connection lost: {e}")
+            self._close()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+            self.reconnects += 1
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.server, self.port)
+
+        flags = 0x02  # clean session
+        payload = _encode_str(self.client_id)
+        if self.user is not None:
+            flags |= 0x80
+            payload += _encode_str(self.user)
+            if self.password is not None:
+                flags |= 0x40
+                payload += _encode_str(self.password)
+        body = b'\x00\x04MQTT\x04' + bytes((flags,)) + self.keepalive.to_bytes(2, 'big') + payload
+        self._writer.write(bytes((_CONNECT,)) + _encode_len(len(body)) + body)
+        await self._writer.drain()
+
+        connack = await self._reader.readexactly(4)
+        if connack[0] != _CONNACK or connack[3] != 0:
+            raise OSError(f"connection refused ({connack[3]})")
+
+        self.connected = True
+        self._last_rx = self._last_tx = time.ticks_ms()
+        self._subs_pending = bool(self._subs)
+        print("MQTT client connected")
+
+        # Messages the broker didn't acknowledge before the connection dropped
+        for pid in sorted(self._inflight):
+            self._send_publish(self._inflight[pid], pid, dup=True)
+        await self._writer.drain()
+
+    def _close(self):
+        self.connected = False
+        if self._writer is not None:
+            try:
+                self._writer.close()
+            except Exception:
+                pass
+        self._reader = self._writer = None
+
+    def _next_pid(self):
+        self._pid = self._pid % 0xFFFF + 1
+        return self._pid
+
+    def _send_publish(self, entry, pid=0, dup=False):
+        topic, msg, retain, qos, _, _ = entry
+        if isinstance(msg, str):
+            msg = msg.encode()
+        topic = _encode_str(topic)
+        length = len(topic) + len(msg) + (2 if qos else 0)
+        header = bytearray((_PUBLISH | dup << 3 | qos << 1 | retain,))
+        header += _encode_len(length)
+        header += topic
+        if qos:
+            header += pid.to_bytes(2, 'big')
+        self._writer.write(header)
+        self._writer.write(msg)
+        self._last_tx = time.ticks_ms()
+
+    def _delivered(self, entry):
+        self.published += 1
+        self.latency.observe(time.ticks_diff(time.ticks_ms(), entry[5]))
+        ts = entry[4]
+        if ts is not None and self.on_delivered:
+            self.on_delivered(ts)
+
+    async def _write_loop(self):
+        # Only this task writes to the socket, the reader leaves acks here
+        writer = self._writer
+        while self.connected:
+            self._wake.clear()
+
+            if self._subs_pending:
+                self._subs_pending = False
+                for topic, qos in self._subs:
+                    body = self._next_pid().to_bytes(2, 'big') + _encode_str(topic) + bytes((qos,))
+                    writer.write(bytes((_SUBSCRIBE,)) + _encode_len(len(body)) + body)
+
+            while self._acks:
+                writer.write(bytes((_PUBACK, 2)) + self._acks.pop(0).to_bytes(2, 'big'))
+
+            while self._count and self.connected:
+                entry = self._queue[self._tail]
+                self._queue[self._tail] = None
+                self._tail = (self._tail + 1) % len(self._queue)
+                self._count -= 1
+                if entry[3]:
+                    pid = self._next_pid()
+                    self._inflight[pid] = entry
+                    self._send_publish(entry, pid)
+                else:
+                    self._send_publish(entry)
+                    self._delivered(entry)
+                await writer.drain()
+
+            now = time.ticks_ms()
+            if time.ticks_diff(now, self._last_rx) > self.keepalive * 1500:
+                raise OSError("keepalive timeout")
+            if time.ticks_diff(now, self._last_tx) >= self.keepalive * 500:
+                writer.write(bytes((_PINGREQ, 0)))
+                self._last_tx = now
+            await writer.drain()
+
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.keepalive / 2)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _read_loop(self):
+        try:
+            while True:
+                header = await self._reader.readexactly(1)
+                length = 0
+                shift = 0
+                while True:
+                    byte = (await self._reader.readexactly(1))[0]
+                    length |= (byte & 0x7F) << shift
+                    shift += 7
+                    if not byte & 0x80:
+                        break
+                body = await self._reader.readexactly(length) if length else b''
+                self._last_rx = time.ticks_ms()
+                self._handle(header[0], body)
+        except Exception as e:
+            print(f"MQTT read failed: {e}")
+        finally:
+            self.connected = False
+            self._wake.set()
+
+    def _handle(self, header, body):
+        kind = header & 0xF0
+        if kind == _PUBACK:
+            entry = self._inflight.pop(int.from_bytes(body[:2], 'big'), None)
+            if entry:
+                self._delivered(entry)
+        elif kind == _PUBLISH:
+            qos = header >> 1 & 0x03
+            topic_len = int.from_bytes(body[:2], 'big')
+            topic = body[2:2 + topic_len]
+            pos = 2 + topic_len
+            if qos:
+                self._acks.append(int.from_bytes(body[pos:pos + 2], 'big'))
+                self._wake.set()
+                pos += 2
+            if self._cb:
+                self._cb(topic, body[pos:])
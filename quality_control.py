@@ -0,0 +1,156 @@
+import time
+
+class QualityController:
+    """
+    Adjusts JPEG quality (and optionally frame size) to the measured link throughput.
+
+    The stream reports the size of every captured frame and every viewer the
+    throughput of its sends. Every `period_ms` the controller estimates the
+    frame rate the best viewer's link can carry at the current frame size and
+    steps the quality down when it falls below `target_fps`, or back up when
+    there is plenty of headroom. The gap between the two thresholds and the
+    fresh measurement required after each change keep it from oscillating.
+
+    The quality and frame size the camera runs with when the controller
+    starts, or after they are changed from the settings page, are used as the
+    ceiling it never goes above.
+
+    Args:
+        cam: The Camera object to adjust.
+        target_fps: Frame rate to hold.
+        min_quality: Lowest JPEG quality to step down to.
+        step: Quality change per decision.
+        frame_sizes: Frame sizes to fall back to once min_quality is reached,
+            smallest first. None to only adjust quality.
+        period_ms: Time between decisions.
+    """
+    # Step down below 85 % of the target fps, step up above 125 %
+    DOWN_PCT = 85
+    UP_PCT = 125
+    # Frame size steps change the frame a lot more than quality steps
+    SIZE_UP_PCT = 200
+
+    def __init__(self, cam, target_fps, min_quality=20, step=5, frame_sizes=None, period_ms=3000):
+        self.cam = cam
+        self.enabled = True
+        self.target_fps = target_fps
+        self.min_quality = min_quality
+        self.step = step
+        self.frame_sizes = frame_sizes
+        self.period_ms = period_ms
+
+        self.max_quality = None
+        self.max_frame_size = None
+        # Averaged frame size in bytes and best viewer throughput in bytes/s
+        self.frame_bytes = 0
+        self.link_rate = 0
+        self._last_decision = time.ticks_ms()
+
+    def reset(self):
+        """
+        Forgets the measurements and takes the camera's current settings as the new ceiling.
+        """
+        self.max_quality = None
+        self.max_frame_size = None
+        self.frame_bytes = 0
+        self.link_rate = 0
+        self._last_decision = time.ticks_ms()
+
+    def record_frame(self, size):
+        if self.frame_bytes == 0:
+            self.frame_bytes = size
+        else:
+            self.frame_bytes += (size - self.frame_bytes) >> 2
+
+    def update(self, viewers):
+        """
+        Called by the capture loop after every frame, decides once per period.
+        """
+        if not self.enabled or not viewers:
+            return
+        if time.ticks_diff(time.ticks_ms(), self._last_decision) < self.period_ms:
+            return
+        self._last_decision = time.ticks_ms()
+
+        if self.max_quality is None:
+            self.max_quality = self.cam.get_quality()
+            if self.frame_sizes:
+                self.max_frame_size = self.cam.get_frame_size()
+
+        rate = 0
+        for viewer in viewers:
+            if viewer.send_rate > rate:
+                rate = viewer.send_rate
+        self.link_rate = rate
+        if rate == 0 or self.frame_bytes == 0:
+            return
+
+        needed = self.target_fps * self.frame_bytes
+        if rate * 100 < needed * self.DOWN_PCT:
+            self._step_down()
+        elif rate * 100 > needed * self.SIZE_UP_PCT and self._can_grow_frame():
+            self._set_frame_size(self.frame_sizes[self.frame_sizes.index(self.cam.get_frame_size()) + 1])
+        elif rate * 100 > needed * self.UP_PCT:
+            quality = self.cam.get_quality()
+            if quality < self.max_quality:
+                self._set_quality(min(quality + self.step, self.max_quality))
+
+    def _step_down(self):
+        quality = self.cam.get_quality()
+        if quality > self.min_quality:
+            self._set_quality(max(quality - self.step, self.min_quality))
+            return
+
+        if self.frame_sizes:
+            frame_size = self.cam.get_frame_size()
+            if frame_size in self.frame_sizes:
+                i = self.frame_sizes.index(frame_size)
+                if i > 0:
+                    self._set_frame_size(self.frame_sizes[i - 1])
+
+    def _can_grow_frame(self):
+        if not self.frame_sizes:
+            return False
+        frame_size = self.cam.get_frame_size()
+        if frame_size not in self.frame_sizes:
+            return False
+        ceiling = len(self.frame_sizes) - 1
+        if self.max_frame_size in self.frame_sizes:
+            ceiling = self.frame_sizes.index(self.max_frame_size)
+        return self.frame_sizes.index(frame_size) < ceiling
+
+    def _set_quality(self, quality):
+        print(f"Link carries ~{self.get_estimated_fps()} fps, setting quality to {quality}")
+        self.cam.set_quality(quality)
+        self._restart_measurement()
+
+    def _set_frame_size(self, frame_size):
+        print(f"Link carries ~{self.get_estimated_fps()} fps, setting frame size to {frame_size}")
+        self.cam.set_frame_size(frame_size)
+        self._restart_measurement()
+
+    def _restart_measurement(self):
+        # Frames of the old size would skew the next decision
+        self.frame_bytes = 0
+
+    # ----- Exposed through /get_ and /set_ -----
+    def get_adaptive(self):
+        return self.enabled
+
+    def set_adaptive(self, value):
+        self.enabled = bool(value)
+        self.reset()
+
+    def get_target_fps(self):
+        return self.target_fps
+
+    def set_target_fps(self, value):
+        self.target_fps = max(1, value)
+
+    def get_estimated_fps(self):
+        if self.frame_bytes == 0:
+            return 0
+        return round(self.link_rate / self.frame_bytes, 1)
+
+    def get_link_rate(self):
+        return self.link_rate
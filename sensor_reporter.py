@@ -0,0 +1,68 @@
+import time
+from array import array
+
+class SensorReporter:
+    """
+    Decides which sensor readings are worth publishing.
+
+    Every sample goes into a moving average. A report is due when an average
+    moved by at least its deadband since the last report, or when no report
+    was made for `max_interval_ms`, so Home Assistant still sees the sensor
+    is alive. Everything is preallocated, adding a sample doesn't allocate.
+
+    Args:
+        deadbands: Smallest change worth reporting for each quantity, in the
+            units of the readings.
+        max_interval_ms: Longest time between two reports.
+        window: Number of samples averaged.
+    """
+    def __init__(self, deadbands, max_interval_ms, window=4):
+        n = len(deadbands)
+        self.deadbands = deadbands
+        self.max_interval_ms = max_interval_ms
+        self.window = window
+        # Averages of the last `window` samples
+        self.values = array('i', [0] * n)
+
+        self.samples = 0
+        self.reports = 0
+        self.suppressed = 0
+
+        self._ring = array('i', [0] * (n * window))
+        self._sums = array('i', [0] * n)
+        self._pos = 0
+        self._filled = 0
+        self._reported = array('i', [0] * n)
+        self._last_report = None
+
+    def add(self, readings):
+        """
+        Adds a sample and returns whether the averages in `values` should be
+        published now.
+        """
+        n = len(self._sums)
+        base = self._pos * n
+        self._pos = (self._pos + 1) % self.window
+        if self._filled < self.window:
+            self._filled += 1
+        for i in range(n):
+            self._sums[i] += readings[i] - self._ring[base + i]
+            self._ring[base + i] = readings[i]
+            self.values[i] = (self._sums[i] + self._filled // 2) // self._filled
+        self.samples += 1
+
+        now = time.ticks_ms()
+        due = self._last_report is None or time.ticks_diff(now, self._last_report) >= self.max_interval_ms
+        i = 0
+        while not due and i < n:
+            due = abs(self.values[i] - self._reported[i]) >= self.deadbands[i]
+            i += 1
+        if not due:
+            self.suppressed += 1
+            return False
+
+        for i in range(n):
+            self._reported[i] = self.values[i]
+        self._last_report = now
+        self.reports += 1
+        return True
@@ -0,0 +1,127 @@
+"""
+Stand-ins for the MicroPython modules the firmware uses, so it can run under
+CPython on Linux.
+
+Call install() before importing any firmware module. It adds the
+MicroPython-only parts of `time`, `asyncio` and `gc` (ticks, sleep_ms,
+ThreadSafeFlag, mem_free) and registers the fake hardware modules in
+sys.modules. `python -m sim` boots the whole firmware, see sim/__main__.py.
+"""
+import asyncio
+import binascii
+import gc
+import sys
+import time
+import tracemalloc
+
+# Heap size gc.mem_free() reports against, about what MicroPython gets on
+# an ESP32-S3 with 8 MB of PSRAM
+HEAP_SIZE = 8 * 1024 * 1024
+
+_TICKS_PERIOD = 1 << 30
+_TICKS_MAX = _TICKS_PERIOD - 1
+_TICKS_HALFPERIOD = _TICKS_PERIOD // 2
+
+def _ticks_ms():
+    return int(time.monotonic() * 1000) & _TICKS_MAX
+
+def _ticks_us():
+    return int(time.monotonic() * 1000000) & _TICKS_MAX
+
+def _ticks_add(ticks, delta):
+    return (ticks + delta) & _TICKS_MAX
+
+def _ticks_diff(end, start):
+    diff = (end - start) & _TICKS_MAX
+    return diff - _TICKS_PERIOD if diff >= _TICKS_HALFPERIOD else diff
+
+def _sleep_ms(ms):
+    time.sleep(ms / 1000)
+
+def _sleep_us(us):
+    time.sleep(us / 1000000)
+
+async def _async_sleep_ms(ms):
+    await asyncio.sleep(ms / 1000)
+
+class ThreadSafeFlag:
+    """
+    CPython stand-in for asyncio.ThreadSafeFlag, set() may be called from any thread.
+    """
+    def __init__(self):
+        self._flag = False
+        self._event = None
+        self._loop = None
+
+    def set(self):
+        self._flag = True
+        loop = self._loop
+        if loop is not None:
+            loop.call_soon_threadsafe(self._event.set)
+
+    def clear(self):
+        self._flag = False
+
+    async def wait(self):
+        if self._loop is None:
+            self._event = asyncio.Event()
+            self._loop = asyncio.get_running_loop()
+        while not self._flag:
+            self._event.clear()
+            if self._flag:
+                break
+            await self._event.wait()
+        self._flag = False
+
+def _mem_alloc():
+    # Only known while tracemalloc traces, see install(trace_heap=True). The
+    # firmware needs the function either way, callers reporting heap numbers
+    # should check tracemalloc.is_tracing() first
+    return tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+
+def _mem_free():
+    return max(0, HEAP_SIZE - _mem_alloc())
+
+_gc_threshold = -1
+
+def _threshold(amount=None):
+    global _gc_threshold
+    if amount is None:
+        return _gc_threshold
+    _gc_threshold = amount
+
+def install(trace_heap=False):
+    """
+    Makes the firmware importable under CPython.
+
+    Args:
+        trace_heap: Trace allocations with tracemalloc, so gc.mem_alloc() and
+            gc.mem_free() report real numbers. Slows everything down.
+    """
+    if trace_heap and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    for name, value in (('mem_alloc', _mem_alloc), ('mem_free', _mem_free), ('threshold', _threshold)):
+        if not hasattr(gc, name):
+            setattr(gc, name, value)
+
+    for name, value in (('ticks_ms', _ticks_ms), ('ticks_us', _ticks_us), ('ticks_add', _ticks_add),
+                        ('ticks_diff', _ticks_diff), ('sleep_ms', _sleep_ms), ('sleep_us', _sleep_us)):
+        if not hasattr(time, name):
+            setattr(time, name, value)
+
+    if not hasattr(asyncio, 'sleep_ms'):
+        asyncio.sleep_ms = _async_sleep_ms
+    if not hasattr(asyncio, 'ThreadSafeFlag'):
+        asyncio.ThreadSafeFlag = ThreadSafeFlag
+
+    from sim import camera, esp, esp32, machine, micropython, network, ustruct, webrepl
+    for module in (camera, esp, esp32, machine, micropython, network, ustruct, webrepl):
+        sys.modules.setdefault(module.__name__[4:], module)
+    sys.modules.setdefault('ubinascii', binascii)
+
+    # Without a config.py the defaults from the template are used
+    try:
+        import config
+    except ImportError:
+        import config_template
+        sys.modules['config'] = config_template
@@ -0,0 +1,72 @@
+"""
+Boots the unchanged firmware on Linux against the fake hardware.
+
+An MQTT broker runs in the same event loop and prints what the doorbell
+publishes, the camera replays JPEGs or generates frames, the BME280 is
+emulated and the button can be pressed periodically.
+
+    python -m sim --http-port 8080 --pics pics --press-every 30
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+async def _press_periodically(machine, pin, every):
+    while True:
+        await asyncio.sleep(every)
+        await machine.press(pin)
+
+async def _print_messages(broker):
+    count = 0
+    while True:
+        await asyncio.sleep(1)
+        for topic, payload, retain in broker.messages[count:]:
+            print(f"[broker] {topic}: {payload[:120]}{' (retained)' if retain else ''}")
+        count = len(broker.messages)
+
+def main(args):
+    sys.path.insert(0, root)
+    sys.path.insert(0, os.path.join(root, 'libs'))
+    import sim
+    sim.install(trace_heap=args.trace_heap)
+
+    import camera
+    import config
+    import machine
+    from sim.broker import Broker
+
+    camera.Camera.fps = args.fps
+    if args.pics:
+        camera.Camera.replay(args.pics)
+    config.MQTT_BROKER = '127.0.0.1'
+    config.MQTT_PORT = args.mqtt_port
+    config.http_port = args.http_port
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    broker = loop.run_until_complete(Broker().start('127.0.0.1', args.mqtt_port))
+    loop.create_task(_print_messages(broker))
+    if args.press_every:
+        loop.create_task(_press_periodically(machine, config.bell_pin, args.press_every))
+
+    # The firmware opens its files relative to the working directory
+    os.chdir(root)
+    print(f"Web UI on http://127.0.0.1:{args.http_port}/, broker on 127.0.0.1:{args.mqtt_port}")
+    import main as firmware
+    try:
+        firmware.main()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--http-port', type=int, default=8080)
+    parser.add_argument('--mqtt-port', type=int, default=1883)
+    parser.add_argument('--pics', help="directory or JPEG file the camera replays, synthetic frames if not given")
+    parser.add_argument('--fps', type=int, default=25, help="frame rate of the camera")
+    parser.add_argument('--press-every', type=float, default=0, help="press the button every this many seconds")
+    parser.add_argument('--trace-heap', action='store_true', help="make gc.mem_free() report real numbers")
+    main(parser.parse_args())
@@ -0,0 +1,156 @@
+"""
+Minimal MQTT 3.1.1 broker to run the firmware's MQTT client against on Linux.
+
+Supports CONNECT, PUBLISH with QoS 0/1 and retain, SUBSCRIBE with exact
+topics and `#`/`+` wildcards, and PINGREQ. Every published message is also
+kept in `Broker.messages` so a harness can inspect what was sent.
+
+    python -m sim.broker --port 1883
+"""
+import argparse
+import asyncio
+
+def topic_matches(pattern, topic):
+    pattern = pattern.split('/')
+    topic = topic.split('/')
+    for i, part in enumerate(pattern):
+        if part == '#':
+            return True
+        if i >= len(topic) or (part != '+' and part != topic[i]):
+            return False
+    return len(pattern) == len(topic)
+
+def _encode_len(n):
+    out = bytearray()
+    while True:
+        byte = n & 0x7F
+        n >>= 7
+        out.append(byte | 0x80 if n else byte)
+        if not n:
+            return bytes(out)
+
+class Broker:
+    """
+    Args:
+        ack_delay: Seconds to wait before acknowledging a QoS 1 publish, to
+            simulate a slow broker.
+    """
+    def __init__(self, ack_delay=0):
+        self.ack_delay = ack_delay
+        self.messages = []
+        self.retained = {}
+        self.connects = 0
+        self._clients = {}
+        self._server = None
+
+    async def start(self, host='127.0.0.1', port=1883):
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self
+
+    def close(self):
+        self._server.close()
+
+    def disconnect_all(self):
+        """
+        Drops every client connection, as a broker restart would.
+        """
+        for writer in list(self._clients):
+            writer.close()
+
+    def publish(self, topic, payload, retain=False):
+        """
+        Publishes a message to the subscribed clients, e.g. Home Assistant's birth message.
+        """
+        if isinstance(payload, str):
+            payload = payload.encode()
+        self._route(topic, payload, retain)
+
+    def _route(self, topic, payload, retain):
+        self.messages.append((topic, payload, retain))
+        if retain:
+            self.retained[topic] = payload
+        for writer, subs in self._clients.items():
+            if any(topic_matches(pattern, topic) for pattern in subs):
+                self._send_publish(writer, topic, payload, retain)
+
+    def _send_publish(self, writer, topic, payload, retain=False):
+        body = len(topic.encode()).to_bytes(2, 'big') + topic.encode() + payload
+        writer.write(bytes((0x30 | retain,)) + _encode_len(len(body)) + body)
+
+    async def _read_packet(self, reader):
+        header = (await reader.readexactly(1))[0]
+        length = 0
+        shift = 0
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            length |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                break
+        return header, await reader.readexactly(length)
+
+    async def _handle(self, reader, writer):
+        subs = []
+        try:
+            header, _ = await self._read_packet(reader)
+            if header != 0x10:
+                return
+            self.connects += 1
+            self._clients[writer] = subs
+            writer.write(b'\x20\x02\x00\x00')
+
+            while True:
+                header, body = await self._read_packet(reader)
+                kind = header & 0xF0
+                if kind == 0x30:
+                    qos = header >> 1 & 0x03
+                    topic_len = int.from_bytes(body[:2], 'big')
+                    topic = body[2:2 + topic_len].decode()
+                    pos = 2 + topic_len
+                    if qos:
+                        pid = body[pos:pos + 2]
+                        pos += 2
+                    self._route(topic, body[pos:], bool(header & 0x01))
+                    if qos:
+                        if self.ack_delay:
+                            await asyncio.sleep(self.ack_delay)
+                        writer.write(b'\x40\x02' + pid)
+                elif kind == 0x80:
+                    pos = 2
+                    granted = bytearray()
+                    while pos < len(body):
+                        topic_len = int.from_bytes(body[pos:pos + 2], 'big')
+                        pattern = body[pos + 2:pos + 2 + topic_len].decode()
+                        subs.append(pattern)
+                        granted.append(min(body[pos + 2 + topic_len], 1))
+                        pos += 3 + topic_len
+                        for topic, payload in self.retained.items():
+                            if topic_matches(pattern, topic):
+                                self._send_publish(writer, topic, payload, True)
+                    writer.write(b'\x90' + _encode_len(2 + len(granted)) + body[:2] + granted)
+                elif kind == 0xC0:
+                    writer.write(b'\xd0\x00')
+                elif kind == 0xE0:
+                    break
+                await writer.drain()
+        except (EOFError, ConnectionError):
+            pass
+        finally:
+            self._clients.pop(writer, None)
+            writer.close()
+
+async def _main(host, port):
+    broker = await Broker().start(host, port)
+    print(f"Broker listening on {host}:{port}")
+    while True:
+        count = len(broker.messages)
+        await asyncio.sleep(1)
+        for topic, payload, retain in broker.messages[count:]:
+            print(f"{topic}: {payload}{' (retained)' if retain else ''}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Minimal MQTT broker for testing the doorbell off-device")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1883)
+    args = parser.parse_args()
+    asyncio.run(_main(args.host, args.port))
@@ -0,0 +1,191 @@
+"""
+Fake of the micropython-camera-API `camera` module.
+
+Camera.capture() blocks like the real driver until the next frame is due at
+`Camera.fps`. It returns a synthetic JPEG whose size follows the frame size
+and quality settings, or replays real JPEG files, see Camera.replay().
+Synthetic frames carry their sequence number and a checksum right after the
+SOI marker, see frame_info().
+
+Like the driver's frame buffers, the frames are memoryviews into a pool of
+`fb_count` buffers that capture() fills in turn, so a frame kept for longer
+than that many captures is overwritten and fails its checksum.
+"""
+import os
+import time
+
+class FrameSize:
+    R96X96 = 0
+    QQVGA = 1
+    QCIF = 2
+    HQVGA = 3
+    R240X240 = 4
+    QVGA = 5
+    CIF = 6
+    HVGA = 7
+    VGA = 8
+    SVGA = 9
+    XGA = 10
+    HD = 11
+    SXGA = 12
+    UXGA = 13
+
+class PixelFormat:
+    RGB565 = 0
+    YUV422 = 1
+    YUV420 = 2
+    GRAYSCALE = 3
+    JPEG = 4
+    RGB888 = 5
+
+_RESOLUTIONS = {
+    FrameSize.R96X96: (96, 96),
+    FrameSize.QQVGA: (160, 120),
+    FrameSize.QCIF: (176, 144),
+    FrameSize.HQVGA: (240, 176),
+    FrameSize.R240X240: (240, 240),
+    FrameSize.QVGA: (320, 240),
+    FrameSize.CIF: (400, 296),
+    FrameSize.HVGA: (480, 320),
+    FrameSize.VGA: (640, 480),
+    FrameSize.SVGA: (800, 600),
+    FrameSize.XGA: (1024, 768),
+    FrameSize.HD: (1280, 720),
+    FrameSize.SXGA: (1280, 1024),
+    FrameSize.UXGA: (1600, 1200),
+}
+
+# Sensor settings the settings page reads and writes, with their defaults
+_SETTINGS = {
+    'contrast': 0, 'brightness': 0, 'saturation': 0, 'aec_value': 0, 'agc_gain': 0,
+    'sharpness': 0, 'denoise': 0, 'gainceiling': 0, 'wb_mode': 0, 'whitebal': True,
+    'awb_gain': True, 'gain_ctrl': True, 'exposure_ctrl': True, 'hmirror': False,
+    'vflip': False, 'lenc': True, 'aec2': False, 'dcw': True, 'bpc': False, 'wpc': True,
+    'raw_gma': True, 'special_effect': 0,
+}
+
+def frame_info(frame):
+    """
+    Returns (sequence number, whether the checksum matches) of a synthetic frame.
+    """
+    seq = int.from_bytes(frame[2:6], 'big')
+    checksum = int.from_bytes(frame[6:10], 'big')
+    return seq, checksum == _checksum(frame[10:-2])
+
+def _checksum(data):
+    return sum(data[::97]) & 0xFFFFFFFF
+
+class Camera:
+    """
+    Fake camera with the same interface as the real Camera object.
+
+    Class attributes can be changed before the firmware creates its Camera:
+
+        fps: Frame rate capture() runs at.
+        frames: JPEG images capture() cycles through, None for synthetic frames.
+    """
+    fps = 25
+    frames = None
+
+    @classmethod
+    def replay(cls, path):
+        """
+        Makes capture() cycle through the .jpg files in directory `path`
+        (e.g. pics/) or the single file `path`.
+        """
+        if os.path.isdir(path):
+            paths = sorted(os.path.join(path, name) for name in os.listdir(path)
+                           if name.lower().endswith(('.jpg', '.jpeg')))
+        else:
+            paths = [path]
+        if not paths:
+            raise ValueError(f"no JPEG files in {path}")
+        frames = []
+        for name in paths:
+            with open(name, 'rb') as f:
+                frames.append(f.read())
+        cls.frames = frames
+
+    def __init__(self, frame_size=FrameSize.VGA, pixel_format=PixelFormat.JPEG, jpeg_quality=85,
+                 fb_count=2, init=True, **pins):
+        self._frame_size = frame_size
+        self._pixel_format = pixel_format
+        self._quality = jpeg_quality
+        self._settings = dict(_SETTINGS)
+        self._initialized = False
+        self._buffers = [bytearray() for _ in range(max(1, fb_count))]
+        self._seq = 0
+        self._next_due = 0.0
+        self.inits = 0
+        if init:
+            self.init()
+
+    def init(self):
+        self._initialized = True
+        self.inits += 1
+        self._next_due = time.monotonic()
+
+    def deinit(self):
+        self._initialized = False
+
+    def capture(self):
+        if not self._initialized:
+            raise RuntimeError("Camera not initialized")
+
+        now = time.monotonic()
+        if now < self._next_due:
+            time.sleep(self._next_due - now)
+            now = self._next_due
+        self._next_due = max(now, self._next_due) + 1 / self.fps
+
+        self._seq += 1
+        if self.frames:
+            frame = self.frames[self._seq % len(self.frames)]
+        else:
+            width, height = _RESOLUTIONS.get(self._frame_size, (640, 480))
+            size = max(64, width * height * self._quality // 1000)
+            payload = bytes((self._seq + i) & 0xFF for i in range(0, size, 61)) * 61
+            payload = payload[:size]
+            frame = (b'\xff\xd8' + self._seq.to_bytes(4, 'big') + _checksum(payload).to_bytes(4, 'big') +
+                     payload + b'\xff\xd9')
+
+        # Reuse the next buffer of the pool, whoever still holds a view into it sees the new frame
+        slot = self._seq % len(self._buffers)
+        buffer = self._buffers[slot]
+        if len(buffer) < len(frame):
+            # A held view keeps a bytearray from being resized, a bigger frame gets a new one
+            buffer = self._buffers[slot] = bytearray(len(frame))
+        buffer[:len(frame)] = frame
+        return memoryview(buffer)[:len(frame)]
+
+    def get_pixel_format(self):
+        return self._pixel_format
+
+    def get_sensor_name(self):
+        return 'OV2640'
+
+    def get_max_frame_size(self):
+        return FrameSize.UXGA
+
+    def get_quality(self):
+        return self._quality
+
+    def set_quality(self, value):
+        self._quality = value
+
+    def get_frame_size(self):
+        return self._frame_size
+
+    def set_frame_size(self, value):
+        self._frame_size = value
+
+    def __getattr__(self, name):
+        # get_<setting>/set_<setting> for the remaining sensor settings
+        if name[:4] in ('get_', 'set_') and name[4:] in _SETTINGS:
+            setting = name[4:]
+            if name.startswith('get_'):
+                return lambda: self._settings[setting]
+            def setter(value):
+                self._settings[setting] = value
+            return setter
+        raise AttributeError(name)
@@ -0,0 +1,6 @@
+"""
+Fake esp module.
+"""
+
+def osdebug(level):
+    pass
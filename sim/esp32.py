@@ -0,0 +1,12 @@
+"""
+Fake esp32 module, the IDF heap is the simulated MicroPython heap.
+"""
+import gc
+
+HEAP_DATA = 4
+HEAP_EXEC = 1
+
+def idf_heap_info(capabilities):
+    # One region: total, free, largest free block, minimum free
+    free = gc.mem_free()
+    return [(gc.mem_free() + gc.mem_alloc(), free, free, free)]
@@ -0,0 +1,99 @@
+"""
+Fake machine module: pins with injectable edges, I2C buses with an emulated
+BME280 at 0x76, and the few board functions the firmware calls.
+"""
+import asyncio
+import time
+
+from sim import i2c as _i2c
+
+# Devices on the I2C buses, change before the firmware opens the bus to
+# emulate other hardware
+i2c_devices = {0x76: _i2c.BME280Device()}
+
+# Returned by unique_id(), the device ID in the MQTT topics is derived from it
+UNIQUE_ID = b'\x24\x6f\x28\x5a\x11\xc0'
+
+def unique_id():
+    return UNIQUE_ID
+
+def idle():
+    time.sleep(0.001)
+
+def freq(hz=None):
+    return 240000000
+
+def reset():
+    raise SystemExit("machine.reset()")
+
+class Pin:
+    """
+    GPIO pin whose input level a harness can drive with set_input(), which
+    calls the IRQ handler on edges matching its trigger, like the hardware.
+    """
+    IN = 1
+    OUT = 3
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_RISING = 1
+    IRQ_FALLING = 2
+
+    # The last Pin created for each pin number, to find the firmware's pins
+    pins = {}
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        self._value = 1 if value is None else value
+        self._handler = None
+        self._trigger = 0
+        Pin.pins[id] = self
+
+    def value(self, value=None):
+        if value is None:
+            return self._value
+        self._value = value
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING):
+        self._handler = handler
+        self._trigger = trigger
+
+    def set_input(self, value):
+        """
+        Drives the pin to `value` from outside.
+        """
+        previous = self._value
+        self._value = value
+        edge = self.IRQ_RISING if value else self.IRQ_FALLING
+        if value != previous and self._handler and self._trigger & edge:
+            self._handler(self)
+
+async def press(pin_id, hold_ms=100):
+    """
+    Presses a button wired from pin `pin_id` to ground for `hold_ms`.
+    """
+    pin = Pin.pins[pin_id]
+    pin.set_input(0)
+    await asyncio.sleep(hold_ms / 1000)
+    pin.set_input(1)
+
+class I2C(_i2c.I2C):
+    def __init__(self, id=0, scl=None, sda=None, freq=400000):
+        super().__init__(i2c_devices, freq)
+
+class SoftI2C(_i2c.I2C):
+    def __init__(self, scl=None, sda=None, freq=400000):
+        super().__init__(i2c_devices, freq)
+
+class WDT:
+    """
+    Watchdog that only reports when it would have reset the board.
+    """
+    def __init__(self, id=0, timeout=5000):
+        self.timeout = timeout
+        self._fed = time.monotonic()
+
+    def feed(self):
+        now = time.monotonic()
+        if (now - self._fed) * 1000 > self.timeout:
+            print(f"WDT: fed after {(now - self._fed) * 1000:.0f} ms, the board would have reset")
+        self._fed = now
@@ -0,0 +1,27 @@
+"""
+Fake micropython module.
+"""
+import asyncio
+
+def const(value):
+    return value
+
+def native(fn):
+    return fn
+
+def viper(fn):
+    return fn
+
+def alloc_emergency_exception_buf(size):
+    pass
+
+def mem_info(verbose=False):
+    import gc
+    print(f"mem: total={gc.mem_alloc() + gc.mem_free()}, current={gc.mem_alloc()}")
+
+def schedule(fn, arg):
+    # Runs fn soon on the event loop, like the firmware's scheduler would
+    try:
+        asyncio.get_running_loop().call_soon_threadsafe(fn, arg)
+    except RuntimeError:
+        fn(arg)
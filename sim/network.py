@@ -0,0 +1,35 @@
+"""
+Fake network module, the WLAN connects at once to the address in `IP`.
+"""
+STA_IF = 0
+AP_IF = 1
+
+IP = '127.0.0.1'
+
+class WLAN:
+    def __init__(self, interface=STA_IF):
+        self._active = False
+        self._connected = False
+
+    def active(self, active=None):
+        if active is None:
+            return self._active
+        self._active = active
+
+    def connect(self, ssid=None, key=None):
+        self._connected = True
+
+    def disconnect(self):
+        self._connected = False
+
+    def isconnected(self):
+        return self._connected
+
+    def status(self, param=None):
+        return -61 if param == 'rssi' else 1010
+
+    def ifconfig(self):
+        return (IP, '255.255.255.0', IP, IP)
+
+    def config(self, *args, **kwargs):
+        return None
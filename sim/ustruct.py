@@ -0,0 +1,8 @@
+"""
+MicroPython's ustruct, which unlike CPython's struct ignores trailing bytes
+after the unpacked values.
+"""
+from struct import calcsize, pack, pack_into, unpack_from
+
+def unpack(fmt, buf):
+    return unpack_from(fmt, buf)
@@ -0,0 +1,9 @@
+"""
+Fake webrepl module, WebREPL isn't available in the simulation.
+"""
+
+def start(port=8266, password=None):
+    pass
+
+def stop():
+    pass
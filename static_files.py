@@ -0,0 +1,77 @@
+import os
+import binascii
+import http_request
+
+# Bytes read from flash and written to the socket at a time
+CHUNK_SIZE = 1024
+
+def _file_info(path):
+    """
+    Returns (size, etag) of a file, or None if it doesn't exist.
+
+    The ETag is the CRC32 of the content, read in chunks once at startup.
+    """
+    try:
+        size = os.stat(path)[6]
+    except OSError:
+        return None
+    crc = 0
+    buf = bytearray(CHUNK_SIZE)
+    with open(path, 'rb') as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            crc = binascii.crc32(memoryview(buf)[:n], crc)
+    return size, f'"{crc:08x}"'
+
+class StaticFile:
+    """
+    A file served from flash, preferably from a gzip-compressed copy.
+
+    If `path`.gz exists it is sent with Content-Encoding: gzip to clients
+    that accept it. The file is streamed in CHUNK_SIZE pieces, never read
+    into memory whole. Responses carry an ETag, so a revisiting browser gets
+    a bare 304.
+
+    Args:
+        path: The uncompressed file, it doesn't have to exist when the .gz does.
+        content_type: Content-Type of the file.
+
+    Raises:
+        OSError: If neither the file nor its .gz exist.
+    """
+    def __init__(self, path, content_type):
+        self.path = path
+        self.content_type = content_type
+        self.plain = _file_info(path)
+        self.gzip = _file_info(path + '.gz')
+        if self.plain is None and self.gzip is None:
+            raise OSError(f"{path} not found")
+
+    async def send(self, request, writer):
+        if self.gzip and ('gzip' in request.headers.get('accept-encoding', '') or self.plain is None):
+            path = self.path + '.gz'
+            size, etag = self.gzip
+            headers = f'Content-Encoding: gzip\r\nVary: Accept-Encoding\r\nETag: {etag}\r\nCache-Control: no-cache\r\n'
+        else:
+            path = self.path
+            size, etag = self.plain
+            headers = f'ETag: {etag}\r\nCache-Control: no-cache\r\n'
+
+        response = http_request.not_modified(request, etag)
+        if response:
+            writer.write(response)
+            await writer.drain()
+            return
+
+        writer.write(http_request.response_header(request, '200 OK', size, self.content_type, headers))
+        buf = bytearray(CHUNK_SIZE)
+        view = memoryview(buf)
+        with open(path, 'rb') as f:
+            while True:
+                n = f.readinto(buf)
+                if not n:
+                    break
+                writer.write(view[:n])
+                await writer.drain()
@@ -1,4 +1,16 @@
 import asyncio
+import json
+import time
+import random
+import config
+import mjpeg
+import metrics
+from memory import gc_manager
+from loop_monitor import monitor
+import http_request
+from static_files import StaticFile
+from quality_control import QualityController
+from capture_thread import FrameGrabber
 from camera import Camera, FrameSize, PixelFormat
 
 cam = Camera(data_pins=[11, 9, 8, 10, 12, 18, 17, 16],
@@ -14,92 +26,657 @@ cam = Camera(data_pins=[11, 9, 8, 10, 12, 18, 17, 16],
              jpeg_quality=85,
              init=False)
 
-html = None
+class CameraManager:
+    """
+    Keeps the camera initialized while it is in use and shortly after.
 
-# TODO: research more about asyncio
-async def stream_camera(writer):
-    
+    Users call acquire() before capturing and release() when done. The sensor
+    is only powered down once nobody has used it for `idle_t` seconds, so
+    clients reconnecting to the stream (as Home Assistant often does) don't
+    pay for the init and warm-up every time.
+
+    Args:
+        cam: The Camera object to manage.
+        idle_t: Seconds without users or requests before the camera is deinitialized.
+        warmup_ms: Time given to the sensor after init before frames are captured.
+    """
+    def __init__(self, cam, idle_t, warmup_ms=1000):
+        self.cam = cam
+        self.idle_t = idle_t
+        self.warmup_ms = warmup_ms
+        self.initialized = False
+        self.users = 0
+        self.last_used = time.ticks_ms()
+        # Time from a stream request to its first frame, of the last stream
+        self.ttff_ms = None
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """
+        Registers a user, initializing the camera first if it is powered down.
+
+        Raises:
+            Exception: Whatever cam.init() raised, the user isn't registered then.
+        """
+        # Counted right away, so the idle watch doesn't power down while we wait for the lock
+        self.users += 1
+        self.touch()
+        try:
+            async with self._lock:
+                if not self.initialized:
+                    self.cam.init()
+                    await asyncio.sleep_ms(self.warmup_ms)
+                    self.initialized = True
+                    print("Camera initialized.")
+                    asyncio.create_task(self._idle_watch())
+        except BaseException:
+            self.users -= 1
+            raise
+
+    def release(self):
+        self.users -= 1
+        self.touch()
+
+    def touch(self):
+        """
+        Marks the camera as recently used, postponing the idle power down.
+        """
+        self.last_used = time.ticks_ms()
+
+    def first_frame(self, requested):
+        """
+        Records the time-to-first-frame of a stream requested at `requested` (ticks_ms).
+        """
+        self.ttff_ms = time.ticks_diff(time.ticks_ms(), requested)
+        print(f"Time to first frame: {self.ttff_ms} ms")
+
+    async def _idle_watch(self):
+        while True:
+            await asyncio.sleep(1)
+            if self.users == 0 and time.ticks_diff(time.ticks_ms(), self.last_used) > self.idle_t * 1000:
+                break
+
+        async with self._lock:
+            self.cam.deinit()
+            self.initialized = False
+        print("Camera idle, deinitialized.")
+
+cam_manager = CameraManager(cam, config.cam_idle_t)
+
+quality_ctl = QualityController(cam, config.target_fps, config.min_quality,
+                                frame_sizes=[FrameSize.QVGA, FrameSize.HVGA, FrameSize.VGA] if config.adapt_frame_size else None)
+quality_ctl.enabled = config.adapt_quality
+
+# The settings page, served from CameraSettings.html.gz when it was copied to the board
+index_page = None
+
+# Most recent frame, shared by the stream and the /capture snapshots
+last_frame = None
+last_frame_t = 0
+# Sequence number of last_frame, the salt keeps ETags unique across reboots
+frame_seq = 0
+_etag_salt = random.getrandbits(16)
+
+# Viewers currently subscribed to the shared MJPEG stream
+viewers = []
+# Task capturing frames for all viewers, None while nobody is watching
+capture_task = None
+# Capture thread feeding the capture loop when config.capture_thread is set
+grabber = None
+
+# Time the capture loop waited for a frame, in ms
+capture_ms = metrics.Histogram((5, 10, 20, 50, 100, 200, 500))
+# Size of the captured frames in bytes
+frame_bytes = metrics.Histogram((8192, 16384, 32768, 65536, 131072, 262144))
+# Time a viewer took to accept one frame, in ms
+drain_ms = metrics.Histogram((5, 10, 20, 50, 100, 200, 500, 1000))
+frames_sent = metrics.Counter()
+frames_dropped = metrics.Counter()
+
+# Seconds a viewer may take to accept one frame before it is considered stalled
+DRAIN_TIMEOUT = 10
+# Seconds an idle persistent connection is kept open for the next request
+KEEPALIVE_TIMEOUT = 5
+
+class _Viewer:
+    """
+    A client subscribed to the shared MJPEG stream.
+
+    The capture loop only drops the newest frame into the viewer's single
+    frame slot, the viewer's own loop in stream_camera() writes it out. If
+    the client hasn't picked up the previous frame yet, it is replaced and
+    counted as dropped, so a slow client gets fewer frames instead of
+    slowing the capture loop down for everybody.
+
+    Viewers asking for a lower rate (fps cap or decimation) get only the
+    frames they want, the rest are skipped before they cost any sending.
+    """
+    def __init__(self, writer, fps=None, decimate=1):
+        self.writer = writer
+        self.interval_ms = 1000 // fps if fps else 0
+        self.decimate = max(1, decimate)
+        self.next_due = time.ticks_ms()
+        self.frames_seen = 0
+        self.part_writer = mjpeg.PartWriter()
+        self.jpeg = True
+        self.frame = None
+        # Frame stream_camera() is writing out
+        self.sending = None
+        self.ready = asyncio.Event()
+        self.closed = False
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.frames_skipped = 0
+        # Averaged throughput of this viewer's sends in bytes/s
+        self.send_rate = 0
+        self.last_sent = time.ticks_ms()
+        self.requested = time.ticks_ms()
+
+    def push(self, frame, jpeg):
+        if self.frame is not None and time.ticks_diff(time.ticks_ms(), self.last_sent) > DRAIN_TIMEOUT * 1000:
+            # Closing the writer makes the pending drain() fail
+            print("Viewer stalled, disconnecting.")
+            self.writer.close()
+
+        if not self._wants_frame():
+            self.frames_skipped += 1
+            return
+
+        if self.frame is not None:
+            self.frames_dropped += 1
+            frames_dropped.inc()
+        self.frame = frame
+        self.jpeg = jpeg
+        self.ready.set()
+
+    def _wants_frame(self):
+        self.frames_seen += 1
+        if self.frames_seen % self.decimate:
+            return False
+
+        if self.interval_ms:
+            now = time.ticks_ms()
+            late = time.ticks_diff(now, self.next_due)
+            if late < 0:
+                return False
+            # Keep a steady cadence, but don't try to catch up after a gap
+            due = self.next_due if late < self.interval_ms else now
+            self.next_due = time.ticks_add(due, self.interval_ms)
+        return True
+
+    def due_in(self):
+        """
+        Returns ms until the viewer wants its next frame, 0 if it takes any frame.
+        """
+        if not self.interval_ms:
+            return 0
+        return max(0, time.ticks_diff(self.next_due, time.ticks_ms()))
+
+    def record_send(self, size, ms):
+        rate = size * 1000 // max(ms, 1)
+        if self.send_rate == 0:
+            self.send_rate = rate
+        else:
+            self.send_rate += (rate - self.send_rate) >> 2
+
+    def close(self):
+        self.closed = True
+        self.frame = None
+        self.ready.set()
+
+class _FramePool:
+    """
+    Reused buffers the frames are copied into out of the driver's.
+
+    The driver, or the capture thread, reuses its buffer for a later frame,
+    while viewers still sending a frame and the /capture cache hold on to it
+    longer. copy() puts the frame into a buffer none of them refers to
+    anymore and only allocates one when all are in use or too small, so in
+    steady state nothing frame-sized is allocated per frame.
+    """
+    def __init__(self):
+        self.buffers = []
+        # The frame each buffer holds, as the view handed out for it
+        self.frames = []
+
+    def copy(self, frame):
+        """
+        Returns a copy of `frame` in a pool buffer, as a memoryview.
+        """
+        size = len(frame)
+        free = None
+        for i in range(len(self.buffers)):
+            if not _frame_in_use(self.frames[i]):
+                free = i
+                if len(self.buffers[i]) >= size:
+                    break
+        if free is None:
+            free = len(self.buffers)
+            self.buffers.append(bytearray())
+            self.frames.append(None)
+        if len(self.buffers[free]) < size:
+            # With some headroom, the frames vary in size
+            self.buffers[free] = bytearray(size + size // 8)
+        view = memoryview(self.buffers[free])[:size]
+        view[:] = frame
+        self.frames[free] = view
+        return view
+
+    def clear(self):
+        """
+        Lets go of the buffers, the frames still in use stay valid.
+        """
+        self.buffers = []
+        self.frames = []
+
+frame_pool = _FramePool()
+# Frames /capture responses are sending
+_snapshots = []
+
+def _frame_in_use(frame):
+    if frame is last_frame:
+        return True
+    for snapshot in _snapshots:
+        if frame is snapshot:
+            return True
+    for viewer in viewers:
+        if frame is viewer.frame or frame is viewer.sending:
+            return True
+    return False
+
+async def _capture_loop():
+    """
+    Captures each frame once and hands it to all subscribed viewers.
+
+    Runs while there are viewers, so adding viewers doesn't add captures and
+    a viewer disconnecting doesn't stop the others. The camera is held
+    through cam_manager for as long as the loop runs.
+
+    With config.capture_thread set, frames come from a FrameGrabber thread
+    instead of blocking the loop in cam.capture().
+    """
+    global capture_task, grabber
+
+    acquired = False
     try:
-        cam.init()
-        await asyncio.sleep(1)
+        await cam_manager.acquire()
+        acquired = True
+        if config.capture_thread:
+            grabber = FrameGrabber(cam)
+            grabber.start()
+        while viewers:
+            # Don't capture faster than the most demanding viewer wants frames
+            wait = 100
+            for viewer in viewers:
+                wait = min(wait, viewer.due_in())
+            if wait:
+                await asyncio.sleep_ms(wait)
+                continue
+
+            # Collect garbage while the sensor exposes the next frame rather
+            # than while a viewer is sending one
+            gc_manager.gap()
+            started = time.ticks_us()
+            frame = await grabber.next_frame() if grabber else cam.capture()
+            capture_ms.observe(time.ticks_diff(time.ticks_us(), started) // 1000)
+            if grabber and not grabber.running:
+                print("Capture thread died, stopping the stream.")
+                break
+            if frame:
+                jpeg = cam.get_pixel_format() == PixelFormat.JPEG
+                # One copy of the frame is shared by all viewers and the cache
+                frame = frame_pool.copy(frame)
+                _cache_frame(frame)
+                frame_bytes.observe(len(frame))
+                quality_ctl.record_frame(len(frame))
+                for viewer in viewers:
+                    viewer.push(frame, jpeg)
+                quality_ctl.update(viewers)
+
+            # Let the viewers send while the next frame is not captured yet
+            await asyncio.sleep(0)
+    except Exception as e:
+        # E.g. the camera failed to initialize, the viewers are disconnected below
+        print(f"Capture failed: {e}")
+    finally:
+        for viewer in viewers[:]:
+            _unsubscribe(viewer)
+        # Viewers that were just unsubscribed may still be sending a frame
+        frame_pool.clear()
+        if grabber:
+            await grabber.stop()
+            print(f"Capture thread stopped, {grabber.frames_captured} frames captured, "
+                  f"{grabber.frames_missed} missed.")
+            grabber = None
+        if acquired:
+            cam_manager.release()
+        capture_task = None
+        print("Streaming stopped.")
+        # Viewers that subscribed while this loop was stopping found it still
+        # running, they need a new one
+        if viewers:
+            _start_capture()
+
+def _start_capture():
+    global capture_task
+    if capture_task is None:
+        capture_task = asyncio.create_task(monitor.timed('capture', _capture_loop()))
+
+def _cache_frame(frame):
+    global last_frame, last_frame_t, frame_seq
+    last_frame = frame
+    last_frame_t = time.ticks_ms()
+    frame_seq += 1
+
+def _frame_etag():
+    return f'"{_etag_salt:x}-{frame_seq}"'
+
+async def _snapshot():
+    """
+    Returns the cached frame, capturing a new one if it is older than config.snap_max_age_ms.
+
+    While the stream is running the cache is refreshed by the capture loop,
+    so snapshots don't touch the camera at all.
+    """
+    if last_frame is not None and time.ticks_diff(time.ticks_ms(), last_frame_t) <= config.snap_max_age_ms:
+        return last_frame
 
-        writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: multipart/x-mixed-replace; boundary=frame\r\n\r\n')
+    try:
+        await cam_manager.acquire()
+    except Exception as e:
+        print(f"Camera init failed: {e}")
+        return None
+    try:
+        # Another request may have refreshed the cache while the camera was initializing
+        if last_frame is None or time.ticks_diff(time.ticks_ms(), last_frame_t) > config.snap_max_age_ms:
+            # Don't capture concurrently with a running capture thread
+            frame = grabber.latest() if grabber else cam.capture()
+            if frame:
+                _cache_frame(frame_pool.copy(frame))
+    finally:
+        cam_manager.release()
+    return last_frame
+
+async def _respond(request, writer, status='200 OK', body=b'', content_type=None):
+    if isinstance(body, str):
+        body = body.encode()
+    writer.write(http_request.response_header(request, status, len(body), content_type))
+    if body:
+        writer.write(body)
+    await writer.drain()
+
+async def send_snapshot(request, writer):
+    """
+    Answers a /capture request with the latest frame as a single image.
+
+    Clients polling with If-None-Match get a bare 304 as long as the frame
+    hasn't changed.
+    """
+    frame = await _snapshot()
+    if frame is None:
+        await _respond(request, writer, '503 Service Unavailable')
+        return
+
+    etag = _frame_etag()
+    response = http_request.not_modified(request, etag)
+    if response:
+        writer.write(response)
+        await writer.drain()
+        return
+
+    content_type = 'image/jpeg' if cam.get_pixel_format() == PixelFormat.JPEG else 'image/bmp'
+    writer.write(http_request.response_header(request, '200 OK', len(frame), content_type,
+                                              f'ETag: {etag}\r\nCache-Control: no-cache\r\n'))
+    # Keeps the frame's pool buffer from being reused while it is sent
+    _snapshots.append(frame)
+    try:
+        await mjpeg.write_chunks(writer, frame)
+    finally:
+        for i in range(len(_snapshots)):
+            if _snapshots[i] is frame:
+                del _snapshots[i]
+                break
+
+def _unsubscribe(viewer):
+    if viewer in viewers:
+        viewers.remove(viewer)
+    viewer.close()
+
+async def stream_camera(writer, fps=None, decimate=1):
+    """
+    Streams frames from the shared capture loop to the client until it disconnects.
+
+    Starts the capture loop if this is the first viewer. Only the newest frame
+    is kept for the client, frames captured while it was still busy sending
+    are dropped.
+
+    Args:
+        writer: The client's stream writer.
+        fps: Maximum frame rate for this client, None for as fast as possible.
+        decimate: Send only every n-th captured frame.
+    """
+    viewer = _Viewer(writer, fps, decimate)
+    try:
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: ' + mjpeg.STREAM_CONTENT_TYPE + b'\r\n\r\n')
         await writer.drain()
 
+        viewers.append(viewer)
+        _start_capture()
+        print(f"Viewer subscribed, {len(viewers)} watching.")
+
         while True:
-            frame = cam.capture()
-            if frame:
-                if cam.get_pixel_format() == PixelFormat.JPEG:
-                    writer.write(b'--frame\r\nContent-Type: image/jpeg\r\n\r\n')
-                else:
-                    writer.write(b'--frame\r\nContent-Type: image/bmp\r\n\r\n')
-                writer.write(frame)
-                await writer.drain()
+            await viewer.ready.wait()
+            viewer.ready.clear()
+            if viewer.closed:
+                break
+
+            frame = viewer.sending = viewer.frame
+            viewer.frame = None
+            started = time.ticks_ms()
+            await viewer.part_writer.write_part(writer, frame, viewer.jpeg)
+            viewer.sending = None
+            ms = time.ticks_diff(time.ticks_ms(), started)
+            viewer.record_send(len(frame), ms)
+            drain_ms.observe(ms)
+            frames_sent.inc()
+            if viewer.frames_sent == 0:
+                cam_manager.first_frame(viewer.requested)
+            viewer.frames_sent += 1
+            viewer.last_sent = time.ticks_ms()
     finally:
-        cam.deinit()
-        writer.close()
-        await writer.wait_closed()
-        print("Streaming stopped and camera deinitialized.")
+        _unsubscribe(viewer)
+        print(f"Viewer left after {viewer.frames_sent} frames sent, {viewer.frames_dropped} dropped, "
+              f"{viewer.frames_skipped} skipped. {len(viewers)} watching.")
+
+async def _handle_stream(request, writer):
+    print("Start streaming...")
+    await stream_camera(writer, request.query_int('fps'), request.query_int('decimate', 1))
+
+# Camera settings in GET/POST /settings, in the order of the settings page
+SETTINGS = ('frame_size', 'quality', 'adaptive', 'target_fps', 'contrast', 'brightness', 'saturation',
+            'aec_value', 'agc_gain', 'sharpness', 'denoise', 'gainceiling', 'wb_mode', 'whitebal',
+            'awb_gain', 'gain_ctrl', 'exposure_ctrl', 'hmirror', 'vflip', 'lenc', 'aec2', 'dcw', 'bpc',
+            'wpc', 'raw_gma', 'special_effect')
+# Sensor properties in GET /settings that can't be set
+READ_ONLY_SETTINGS = ('max_frame_size', 'sensor_name', 'pixel_format')
+
+def _setting_method(kind, name):
+    """
+    Returns the camera's or the quality controller's get_/set_ method for a
+    setting, None if neither has it.
+    """
+    method = getattr(cam, f'{kind}_{name}', None) or getattr(quality_ctl, f'{kind}_{name}', None)
+    return method if callable(method) else None
+
+def _apply_setting(name, value):
+    set_method = _setting_method('set', name)
+    if set_method is None:
+        return False
+    print(f"Setting {name} to {value}")
+    set_method(value)
+    if name in ('quality', 'frame_size'):
+        # The user's choice becomes the controller's new ceiling
+        quality_ctl.reset()
+    return True
+
+def _settings_json():
+    settings = {}
+    for names in (SETTINGS, READ_ONLY_SETTINGS):
+        for name in names:
+            get_method = _setting_method('get', name)
+            if get_method is None:
+                continue
+            try:
+                settings[name] = get_method()
+            except Exception:
+                # Not supported by this sensor
+                pass
+    return json.dumps(settings)
+
+async def _handle_settings(request, writer):
+    """
+    GET returns all settings as one JSON object, POST applies a JSON object
+    of settings and answers with the resulting settings. If any of them is
+    unknown or not a number, POST changes nothing and answers 400 with
+    their names.
+    """
+    cam_manager.touch()
+    if request.method == 'POST':
+        try:
+            changes = json.loads(request.body)
+        except ValueError:
+            changes = None
+        if not isinstance(changes, dict):
+            await _respond(request, writer, '400 Bad Request')
+            return
+
+        # Check all of them first, so a 400 means nothing was changed
+        values = {}
+        invalid = []
+        for name, value in changes.items():
+            try:
+                if name in SETTINGS and _setting_method('set', name) is not None:
+                    values[name] = int(value)
+                    continue
+            except (TypeError, ValueError):
+                pass
+            invalid.append(name)
+        if invalid:
+            await _respond(request, writer, '400 Bad Request', json.dumps({'invalid': invalid}), 'application/json')
+            return
+        for name, value in values.items():
+            _apply_setting(name, value)
+
+    await _respond(request, writer, body=_settings_json(), content_type='application/json')
+
+async def _handle_set(request, writer):
+    cam_manager.touch()
+    method_name = request.path[len('/set_'):]
+    value = request.query_int('value')
+    if _setting_method('set', method_name) is None:
+        await _respond(request, writer, '404 Not Found')
+    elif value is None:
+        await _respond(request, writer, '400 Bad Request')
+    else:
+        _apply_setting(method_name, value)
+        await _respond(request, writer)
+
+async def _handle_get(request, writer):
+    cam_manager.touch()
+    method_name = request.path[len('/get_'):]
+    get_method = _setting_method('get', method_name)
+    if get_method is None:
+        await _respond(request, writer, '404 Not Found')
+        return
+    value = get_method()
+    print(f"{method_name} is {value}")
+    await _respond(request, writer, body=str(value))
+
+async def _handle_metrics(request, writer):
+    await _respond(request, writer, body=metrics.render(), content_type='text/plain; version=0.0.4')
+
+async def _handle_index(request, writer):
+    await index_page.send(request, writer)
+
+# Handlers by exact path, then by path prefix, anything else gets the settings page
+_routes = {
+    '/stream': _handle_stream,
+    '/capture': send_snapshot,
+    '/settings': _handle_settings,
+    '/metrics': _handle_metrics,
+}
+_prefix_routes = (
+    ('/set_', _handle_set),
+    ('/get_', _handle_get),
+)
+
+def _route(path):
+    handler = _routes.get(path)
+    if handler is not None:
+        return handler
+    for prefix, handler in _prefix_routes:
+        if path.startswith(prefix):
+            return handler
+    return _handle_index
+
+metrics.register('doorbell_capture_ms', "Time the capture loop waited for a frame", capture_ms)
+metrics.register('doorbell_frame_bytes', "Size of the captured frames", frame_bytes)
+metrics.register('doorbell_drain_ms', "Time a viewer took to accept one frame", drain_ms)
+metrics.register('doorbell_frames_sent_total', "Frames sent to viewers", frames_sent)
+metrics.register('doorbell_frames_dropped_total', "Frames replaced before a slow viewer took them", frames_dropped)
+metrics.register('doorbell_viewers', "Viewers watching the stream", lambda: len(viewers))
+metrics.register('doorbell_jpeg_quality', "JPEG quality the camera runs with", cam.get_quality)
 
 async def handle_client(reader, writer):
+    """
+    Serves requests on one connection until the client closes it, asks to,
+    or stays idle for KEEPALIVE_TIMEOUT seconds.
+    """
     try:
-        request = await reader.read(1024)
-        request = request.decode()
-
-        if 'GET /stream' in request:
-            print("Start streaming...")
-            await stream_camera(writer)
-
-        elif 'GET /set_' in request:
-            method_name = request.split('GET /set_')[1].split('?')[0]
-            value = int(request.split('value=')[1].split(' ')[0])
-            set_method = getattr(cam, f'set_{method_name}', None)
-            if callable(set_method):
-                print(f"Setting {method_name} to {value}")
-                set_method(value)
-                response = 'HTTP/1.1 200 OK\r\n\r\n'
-                writer.write(response.encode())
-                await writer.drain()
-            else:
-                response = 'HTTP/1.1 404 Not Found\r\n\r\n'
-                writer.write(response.encode())
-                await writer.drain()
-
-        elif 'GET /get_' in request:
-            method_name = request.split('GET /get_')[1].split(' ')[0]
-            get_method = getattr(cam, f'get_{method_name}', None)
-            if callable(get_method):
-                value = get_method()
-                print(f"{method_name} is {value}")
-                response = f'HTTP/1.1 200 OK\r\n\r\n{value}'
-                writer.write(response.encode())
-                await writer.drain()
-            else:
-                response = 'HTTP/1.1 404 Not Found\r\n\r\n'
-                writer.write(response.encode())
+        timeout = None
+        while True:
+            try:
+                if timeout is None:
+                    request = await http_request.read_request(reader)
+                else:
+                    request = await asyncio.wait_for(http_request.read_request(reader), timeout)
+            except http_request.HTTPError as e:
+                writer.write(f'HTTP/1.1 {e.status}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n'.encode())
                 await writer.drain()
+                break
+            except asyncio.TimeoutError:
+                break
 
-        else:
-            global html
-            writer.write('HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n\r\n'.encode())
-            writer.write(html.encode())
-            await writer.drain()
+            if request is None:
+                break
+            handler = _route(request.path)
+            await handler(request, writer)
+            # A stream only ends when the client goes away
+            if not request.keep_alive or handler is _handle_stream:
+                break
+            timeout = KEEPALIVE_TIMEOUT
     except Exception as e:
         print(f"Error: {e}")
     finally:
         writer.close()
-        await writer.wait_closed()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            # The client reset the connection
+            pass
+
+def _timed_client(reader, writer):
+    return monitor.timed('http', handle_client(reader, writer))
 
-def stream_server_start(ip, port=80):
+async def stream_server_start(ip, port=80):
+    global index_page
     try:
-        with open("CameraSettings.html", 'r') as file:
-            global html
-            html = file.read()
+        index_page = StaticFile("CameraSettings.html", 'text/html')
     except Exception as e:
         print("Error reading CameraSettings.html file. You might forgot to copy it from the examples folder.")
         raise e
 
-    server = await asyncio.start_server(handle_client, ip, port)
+    server = await asyncio.start_server(_timed_client, ip, port)
     print(f"Server is running on {ip}:{port}")
     while True:
         await asyncio.sleep(3600)